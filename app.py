@@ -13,11 +13,18 @@ from apps import (
     photoshop,
 )
 from apps.emami_ghafari_quantity_syncer import main as emami_ghafari_quantity_syncer
+from apps.emami_ghafari_quantity_syncer.services import spool as emami_spool
+from apps.emami_ghafari_quantity_syncer.services import history as emami_history
+from apps.common.jobs import jobs, JobQueueFull
+from apps.digikala.checkpoint import ScrapeCheckpoint, valid_job_id
+from apps.digikala.export import AttributePivot, export_bytes, stream_csv
 import cv2
 import numpy as np
 from PIL import Image
 
 app = Flask(__name__)
+# periodic Emami-Ghafari sync (EMAMI_GHAFARI_SYNC_INTERVAL_MINUTES)
+emami_ghafari_quantity_syncer.start_scheduler()
 
 
 # ---------------------------------
@@ -44,12 +51,109 @@ def index():
     return render_template_string(digi_attributes_scraping.html)
 
 
+def _category_urls(values):
+    """Category URLs from repeated `category_url` fields, one or more per line."""
+    return [
+        url.strip()
+        for value in values.getlist("category_url")
+        for url in value.splitlines()
+        if url.strip()
+    ]
+
+
+def _scrape_options(values):
+    """Scrape options from the request; raises ValueError for out-of-range ones."""
+    options = {
+        "rate": values.get(
+            "rate", digi_attributes_scraping.REQUESTS_PER_SECOND, type=float
+        ),
+        "workers": values.get(
+            "workers", digi_attributes_scraping.PDP_WORKERS, type=int
+        ),
+        "force_refresh": values.get("force_refresh", "0") in ("1", "true", "on"),
+        "delta": values.get("delta", "0") in ("1", "true", "on"),
+    }
+    if not 0 < options["rate"] <= digi_attributes_scraping.MAX_REQUESTS_PER_SECOND:
+        raise ValueError(
+            "rate must be above 0 and at most "
+            f"{digi_attributes_scraping.MAX_REQUESTS_PER_SECOND:g}"
+        )
+    if not 1 <= options["workers"] <= digi_attributes_scraping.MAX_PDP_WORKERS:
+        raise ValueError(
+            f"workers must be between 1 and {digi_attributes_scraping.MAX_PDP_WORKERS}"
+        )
+    return options
+
+
+@app.route("/scrape/jobs", methods=["POST"])
+def scrape_job_start():
+    job_id = request.values.get("job_id")
+    if job_id and not valid_job_id(job_id):
+        return jsonify({"error": "invalid job_id"}), 400
+    try:
+        options = _scrape_options(request.values)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        job = digi_attributes_scraping.submit_job(
+            _category_urls(request.values), job_id=job_id, **options
+        )
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 429
+    return jsonify(job.to_dict()), 202
+
+
+@app.route("/scrape/jobs/<job_id>/attributes")
+def scrape_job_attributes(job_id):
+    if not valid_job_id(job_id):
+        return jsonify({"error": "invalid job_id"}), 400
+    summary = digi_attributes_scraping.attribute_summary(job_id)
+    if summary is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(summary)
+
+
+@app.route("/scrape/jobs/<job_id>/export.<fmt>")
+def scrape_job_export(job_id, fmt):
+    if not valid_job_id(job_id) or ScrapeCheckpoint.load(job_id) is None:
+        return jsonify({"error": "job not found"}), 404
+    pivot = AttributePivot(job_id)
+    if fmt == "csv":
+        return Response(
+            stream_csv(pivot),
+            mimetype="text/csv",
+            headers={
+                "Content-Disposition": f"attachment; filename=digikala-{job_id}.csv"
+            },
+        )
+    if fmt not in ("xlsx", "parquet"):
+        return jsonify({"error": f"unsupported format: {fmt}"}), 400
+    try:
+        buffer = export_bytes(pivot, fmt)
+    except ImportError as e:
+        return jsonify({"error": f"{fmt} export is not available: {e}"}), 400
+    return send_file(
+        buffer, as_attachment=True, download_name=f"digikala-{job_id}.{fmt}"
+    )
+
+
 @app.route("/scrape")
 def scrape():
-    category_url = request.args.get("category_url")
-    return Response(
-        digi_attributes_scraping.generate(category_url), mimetype="text/event-stream"
-    )
+    """Start (or rejoin) a scrape job and stream its events on this connection."""
+    job_id = request.args.get("job_id")
+    if job_id and not valid_job_id(job_id):
+        return jsonify({"error": "invalid job_id"}), 400
+    try:
+        options = _scrape_options(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        job = digi_attributes_scraping.submit_job(
+            _category_urls(request.args), job_id=job_id, **options
+        )
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 429
+    return _job_stream(job)
 
 
 # ---------------------------------
@@ -68,13 +172,138 @@ def emami_sync_page():
     return render_template_string(emami_ghafari_quantity_syncer.main_html)
 
 
+@app.route("/emami-ghafari-sync/jobs", methods=["POST"])
+def emami_sync_job_start():
+    try:
+        job = emami_ghafari_quantity_syncer.submit_job()
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 429
+    except emami_ghafari_quantity_syncer.SheetBusy as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify(job.to_dict()), 202
+
+
+@app.route("/emami-ghafari-sync/status")
+def emami_sync_status():
+    """Running, last and next (scheduled) sync, with durations."""
+    return jsonify(emami_ghafari_quantity_syncer.sync_status())
+
+
+@app.route("/emami-ghafari-sync/spool")
+def emami_spool_list():
+    return jsonify(emami_spool.list_runs())
+
+
+@app.route("/emami-ghafari-sync/spool/<run_id>.csv.gz")
+def emami_spool_download(run_id):
+    if not emami_spool.valid_run_id(run_id):
+        return jsonify({"error": "invalid run_id"}), 400
+    if not emami_spool.spool_exists(run_id):
+        return jsonify({"error": "run not found"}), 404
+    return send_file(
+        emami_spool.spool_path(run_id),
+        as_attachment=True,
+        download_name=f"emami-ghafari-{run_id}.csv.gz",
+    )
+
+
+@app.route("/emami-ghafari-sync/spool/<run_id>/upload", methods=["POST"])
+def emami_spool_upload(run_id):
+    """Retry the Google Sheets upload of a spooled result without crawling again."""
+    if not emami_spool.valid_run_id(run_id):
+        return jsonify({"error": "invalid run_id"}), 400
+    if not emami_spool.spool_exists(run_id):
+        return jsonify({"error": "run not found"}), 404
+    try:
+        job = emami_ghafari_quantity_syncer.submit_upload_job(run_id)
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 429
+    except emami_ghafari_quantity_syncer.SheetBusy as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify(job.to_dict()), 202
+
+
+@app.route("/emami-ghafari-sync/history")
+def emami_history_list():
+    return jsonify(emami_history.snapshots())
+
+
+@app.route("/emami-ghafari-sync/history/changes")
+def emami_history_changes():
+    """What changed since run `since` (up to run `until`, default: the latest)."""
+    since = request.args.get("since", "")
+    until = request.args.get("until") or None
+    if not emami_spool.valid_run_id(since) or (
+        until and not emami_spool.valid_run_id(until)
+    ):
+        return jsonify({"error": "invalid run_id"}), 400
+    limit = request.args.get("limit", emami_history.CHANGES_SHOWN, type=int)
+    result = emami_history.changes(since, until, limit)
+    if result is None:
+        return jsonify({"error": "run not found"}), 404
+    return jsonify(result)
+
+
+@app.route("/emami-ghafari-sync/history/sku/<path:technical_number>")
+def emami_history_series(technical_number):
+    """Price and quantity of one product across the stored syncs."""
+    points = emami_history.series(technical_number)
+    if points is None:
+        return jsonify({"error": "product not found"}), 404
+    return jsonify({"technical_number": technical_number, "series": points})
+
+
 @app.route("/emami-ghafari-sync-run")
 def emami_sync_run():
+    try:
+        job = emami_ghafari_quantity_syncer.submit_job()
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 429
+    except emami_ghafari_quantity_syncer.SheetBusy as e:
+        return jsonify({"error": str(e)}), 409
+    return _job_stream(job)
+
+
+# ---------------------------------
+# background jobs -----------------
+# ---------------------------------
+def _job_stream(job):
+    # EventSource sends Last-Event-ID by itself when it reconnects
+    last_event_id = request.headers.get(
+        "Last-Event-ID", request.args.get("last_event_id", 0)
+    )
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        last_event_id = 0
     return Response(
-        emami_ghafari_quantity_syncer.generate(), mimetype="text/event-stream"
+        job.subscribe(last_event_id),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
+@app.route("/jobs")
+def jobs_list():
+    return jsonify([job.to_dict() for job in jobs.list()])
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    return _job_stream(job)
+
+
 @app.route("/apply-all", methods=["POST"])
 def apply_all():
     if "image" not in request.files:
@@ -0,0 +1,255 @@
+import queue
+import threading
+import time
+import traceback
+import uuid
+from typing import Callable, Iterable, Iterator
+
+from apps.common.sse import keepalive, sse
+
+MAX_RUNNING_JOBS = 2  # crawls running at the same time
+MAX_QUEUED_JOBS = 8  # jobs waiting for a free slot before submits are refused
+JOB_RETENTION_SECONDS = 3600  # finished jobs stay subscribable this long
+KEEPALIVE_SECONDS = 15
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    """A background crawl and its in-memory event log.
+
+    Events are plain dicts; their SSE id is their 1-based position in the
+    log, so any number of subscribers can attach at any time and resume
+    from a Last-Event-ID. A source that keeps its own event log on disk can
+    pass `load_events(first, last)` and yield the log id of an event
+    instead of the event: only that int is kept in memory, the event is
+    read back from the log when a subscriber needs it, and its SSE id is
+    its log id, so it stays the same when the job is run again. The dicts
+    such a source yields are transient and are streamed without an id.
+    """
+
+    def __init__(
+        self,
+        job_id: str,
+        kind: str,
+        run: Callable[[], Iterable[dict]],
+        params=None,
+        key: str | None = None,
+        load_events: Callable[[int, int], list[dict]] | None = None,
+    ):
+        self.id = job_id
+        self.kind = kind
+        self.key = key
+        self.params = params or {}
+        self.status = "queued"
+        self.events = []  # (SSE id or None, event or log id)
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._run = run
+        self._load_events = load_events
+        self._cond = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def publish(self, event: dict | int) -> None:
+        with self._cond:
+            if isinstance(event, int):
+                event_id = event
+            elif self._load_events is None:
+                event_id = len(self.events) + 1
+            else:
+                event_id = None
+            self.events.append((event_id, event))
+            self._cond.notify_all()
+
+    def execute(self) -> None:
+        with self._cond:
+            self.status = "running"
+            self.started_at = time.time()
+        try:
+            for event in self._run():
+                self.publish(event)
+        except Exception:
+            self.publish(
+                {
+                    "type": "ERROR",
+                    "msg": "خطای غیرمنتظره",
+                    "detail": traceback.format_exc(),
+                }
+            )
+        with self._cond:
+            # sources report their own failures as a final ERROR event
+            last = self.events[-1][1] if self.events else None
+            failed = isinstance(last, dict) and last.get("type") == "ERROR"
+            self.status = "failed" if failed else "done"
+            self.finished_at = time.time()
+            self._cond.notify_all()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until the job has finished; False if `timeout` ran out first."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.finished, timeout)
+
+    def _resolve(self, batch: list) -> list[tuple]:
+        """(SSE id, event) pairs of a slice of the log; logged ones are read back."""
+        events, run = [], []
+        for event_id, item in batch + [(None, None)]:
+            if isinstance(item, int) and (not run or item == run[-1] + 1):
+                run.append(item)
+                continue
+            if run:
+                events.extend(zip(run, self._load_events(run[0], run[-1])))
+                run = []
+            if isinstance(item, int):
+                run.append(item)
+            elif item is not None:
+                events.append((event_id, item))
+        return events
+
+    @staticmethod
+    def _skip_through(batch: list, last_event_id: int) -> int | None:
+        # how many events of `batch` precede the first one after
+        # `last_event_id`; None if it is not in the batch yet
+        for index, (event_id, _) in enumerate(batch):
+            if event_id is not None and event_id >= last_event_id:
+                return index + (event_id == last_event_id)
+        return None
+
+    def subscribe(self, last_event_id: int = 0) -> Iterator[str]:
+        """SSE stream of the events after `last_event_id`, live until the job ends."""
+        position, resuming = 0, last_event_id > 0
+        while True:
+            with self._cond:
+                if position >= len(self.events) and not self.finished:
+                    self._cond.wait(timeout=KEEPALIVE_SECONDS)
+                batch = self.events[position:]
+                finished = self.finished
+            if resuming:
+                # events before the resume point, and those without an id
+                # among them, were already seen
+                skipped = self._skip_through(batch, last_event_id)
+                resuming = skipped is None
+                skipped = len(batch) if resuming else skipped
+                position += skipped
+                batch = batch[skipped:]
+                if skipped and not batch and not finished:
+                    continue
+            if not batch:
+                if finished:
+                    return
+                yield keepalive()
+                continue
+            for event_id, event in self._resolve(batch):
+                yield sse(event, event_id)
+            position += len(batch)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "params": self.params,
+            "events": len(self.events),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """In-process job runner with a global concurrency cap and a bounded queue."""
+
+    def __init__(
+        self, max_running: int = MAX_RUNNING_JOBS, max_queued: int = MAX_QUEUED_JOBS
+    ):
+        self.max_running = max_running
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = {}
+        self._active = {}  # single-flight key -> unfinished job
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def _start_workers(self) -> None:
+        while len(self._workers) < self.max_running:
+            worker = threading.Thread(
+                target=self._work,
+                name=f"job-worker-{len(self._workers) + 1}",
+                daemon=True,
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                job.execute()
+            finally:
+                self._queue.task_done()
+
+    def _prune(self) -> None:
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished_at < cutoff:
+                del self._jobs[job_id]
+        for key, job in list(self._active.items()):
+            if job.finished:
+                del self._active[key]
+
+    def submit(
+        self,
+        kind: str,
+        run: Callable[[], Iterable[dict]],
+        params=None,
+        job_id=None,
+        key=None,
+        load_events=None,
+    ) -> Job:
+        """Queue a job; returns the existing job while `job_id` is queued or running.
+
+        A finished or failed job submitted again under its id is run anew
+        (e.g. a scrape resuming from its checkpoint).
+
+        Jobs submitted with the same single-flight `key` while one of them is
+        still queued or running are coalesced: the caller gets the in-flight
+        job, whose subscribers see every event from the start.
+        Raises JobQueueFull when MAX_QUEUED_JOBS jobs are already waiting.
+        """
+        with self._lock:
+            self._prune()
+            if job_id and job_id in self._jobs and not self._jobs[job_id].finished:
+                return self._jobs[job_id]
+            if key and key in self._active and not self._active[key].finished:
+                return self._active[key]
+            job = Job(job_id or uuid.uuid4().hex, kind, run, params, key, load_events)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise JobQueueFull("صف کارها پر است، لطفا کمی بعد دوباره تلاش کنید.")
+            self._jobs[job.id] = job
+            if key:
+                self._active[key] = job
+            self._start_workers()
+            return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active(self, key: str) -> Job | None:
+        """The queued or running job of a single-flight key, if any."""
+        with self._lock:
+            job = self._active.get(key)
+            return job if job is not None and not job.finished else None
+
+    def list(self) -> list[Job]:
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.created_at)
+
+
+jobs = JobManager()
@@ -0,0 +1,129 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter.
+
+    `rate` tokens are added per second up to `capacity`; `acquire` blocks the
+    calling thread until a token is available, so any number of workers can
+    share one requests-per-second budget.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate: float) -> None:
+        """Change the refill rate without losing already accrued tokens."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    """Token bucket plus a concurrency gate, both tuned with AIMD.
+
+    Throttling (429/5xx) halves the rate and the number of concurrent
+    requests and pauses everyone for `Retry-After` when the server sends it;
+    healthy responses raise the rate back by `increase` requests/second per
+    second of traffic and the concurrency by one per window of successes,
+    never beyond the configured ceilings.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        concurrency: int,
+        min_rate: float = 0.2,
+        increase: float = 0.5,
+        decrease: float = 0.5,
+    ):
+        super().__init__(rate)
+        self.max_rate = float(rate)
+        self.min_rate = min(min_rate, self.max_rate)
+        self.max_concurrency = concurrency
+        self.concurrency = concurrency
+        self.increase = increase
+        self.decrease = decrease
+        self.throttled = 0
+        self._active = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._last_decrease = float("-inf")
+        self.decrease_cooldown = 1.0
+        self._gate = threading.Condition()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """Wait for a concurrency slot and a token; pair every call with `release`."""
+        with self._gate:
+            while self._active >= self.concurrency:
+                self._gate.wait()
+            self._active += 1
+        try:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+            super().acquire(tokens)
+        except BaseException:
+            self.release()
+            raise
+
+    def release(self) -> None:
+        with self._gate:
+            self._active -= 1
+            self._gate.notify()
+
+    def on_success(self) -> None:
+        with self._gate:
+            self._successes += 1
+            if self._successes >= self.concurrency:
+                self._successes = 0
+                if self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+                    self._gate.notify()
+        if self.rate < self.max_rate:
+            # +increase per second of traffic: one success is 1/rate seconds
+            self.set_rate(min(self.max_rate, self.rate + self.increase / self.rate))
+
+    def on_throttle(self, retry_after: float | None = None) -> None:
+        now = time.monotonic()
+        with self._gate:
+            self.throttled += 1
+            self._successes = 0
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            # requests already in flight tend to be throttled together;
+            # back off once per burst rather than once per response
+            if now - self._last_decrease < self.decrease_cooldown:
+                return
+            self._last_decrease = now
+            self.concurrency = max(1, int(self.concurrency * self.decrease))
+        self.set_rate(max(self.min_rate, self.rate * self.decrease))
+
+    def snapshot(self) -> dict:
+        return {
+            "rate": round(self.rate, 2),
+            "concurrency": self.concurrency,
+            "throttled": self.throttled,
+        }
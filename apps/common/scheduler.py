@@ -0,0 +1,70 @@
+import threading
+import time
+import traceback
+from typing import Callable
+
+from apps.common.jobs import Job
+
+
+class PeriodicJob:
+    """Submits a background job every `interval` seconds from a daemon thread.
+
+    The next run is due `interval` seconds after the previous one finished,
+    so slow runs never pile up. `submit` should use a single-flight key: a
+    tick that lands while a manual run is in progress joins that run instead
+    of starting another. A failed submit (e.g. a full queue) is retried on
+    the next tick.
+    """
+
+    def __init__(self, name: str, interval: float, submit: Callable[[], Job]):
+        self.name = name
+        self.interval = interval
+        self.next_run_at = None
+        self.last_error = None
+        self._submit = submit
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    def start(self, first_delay: float | None = None) -> None:
+        """Start ticking; the first run is due after `first_delay` (default: `interval`)."""
+        if not self.enabled or self._thread is not None:
+            return
+        delay = self.interval if first_delay is None else max(0.0, first_delay)
+        self._thread = threading.Thread(
+            target=self._loop,
+            args=(delay,),
+            name=f"schedule-{self.name}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self, delay: float) -> None:
+        while True:
+            self.next_run_at = time.time() + delay
+            if self._stop.wait(delay):
+                return
+            self.next_run_at = None
+            try:
+                job = self._submit()
+                self.last_error = None
+            except Exception:
+                self.last_error = traceback.format_exc()
+            else:
+                job.wait()
+            delay = self.interval
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "enabled": self.enabled,
+            "interval_seconds": self.interval,
+            "next_run_at": self.next_run_at,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,14 @@
+import json
+
+
+def sse(msg_obj: dict, event_id: int | None = None) -> str:
+    """Format one Server-Sent Events message, with an optional `id:` line."""
+    data = f"data: {json.dumps(msg_obj, ensure_ascii=False)}\n\n"
+    if event_id is None:
+        return data
+    return f"id: {event_id}\n{data}"
+
+
+def keepalive() -> str:
+    # SSE comment line; lets the server notice disconnected clients while idle
+    return ": keepalive\n\n"
@@ -0,0 +1,11 @@
+import os
+
+# local state (caches, checkpoints, spools); mount a volume here in docker
+DATA_DIR = os.environ.get("AUTOMOBY_DATA_DIR", os.path.join(os.getcwd(), "data"))
+
+
+def data_path(*parts: str) -> str:
+    """Return a path under DATA_DIR, creating its parent directory."""
+    path = os.path.join(DATA_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
@@ -1,18 +1,94 @@
+import os
 import requests
 import time
-import json
+import queue
+import random
+import threading
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from apps.common.jobs import jobs
+from apps.common.rate_limit import AdaptiveRateLimiter
+from apps.common.sse import sse
+from apps.digikala.cache import get_product_cache
+from apps.digikala.checkpoint import EventLogReader, ScrapeCheckpoint, new_job_id
+from apps.digikala.export import AttributePivot
+from apps.digikala.aggregator import AttributeAggregator
+from apps.digikala.records import (
+    PRODUCT_URL,
+    ProductRecord,
+    category_slug,
+    dkp_from_url,
+    parse_product,
+)
+from apps.digikala.snapshot import CategorySnapshot
+
+# ---------------- Settings ----------------
+PDP_WORKERS = 8  # max concurrent product (PDP) requests
+REQUESTS_PER_SECOND = 4.0  # shared budget for all Digikala API calls of a scrape
+# upper bounds for the rate/workers a client may ask for
+MAX_REQUESTS_PER_SECOND = 20.0
+MAX_PDP_WORKERS = PDP_WORKERS * 4
+PLP_LOOKAHEAD = 3  # listing pages the producer may fetch ahead of the PDP stage
+MAX_BACKOFF_SECONDS = 60
+# point at a local stand-in (see benchmarks/fake_digikala.py) for offline runs
+API_BASE_URL = os.environ.get("DIGIKALA_API_URL", "https://api.digikala.com")
+PLP_PATH = "/v1/categories/{category}/search/?page={page}"
+PDP_PATH = "/v2/product/{dkp}/"
+STATUS_INTERVAL_SECONDS = 2  # min gap between limiter STATUS events
+RETRY_ROUNDS = 3  # passes over the retry queue once the category is crawled
+RETRY_BASE_SECONDS = 5  # wait before the first retry pass, doubled per pass
+ATTRIBUTES_EVERY = 100  # products between live ATTRIBUTES summary events
+KEPT_AGGREGATORS = 20  # attribute aggregators of recent jobs kept in memory
+PRODUCT_EVENTS = ("PDP_PROGRESS", "NEW", "CHANGED")  # logged events with product data
 
 
 # ---------------- Helper Functions ----------------
-def safe_request(url, retries=3, wait=5):
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt, base, cap=MAX_BACKOFF_SECONDS):
+    # "full jitter" exponential backoff
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def safe_request(url, retries=5, wait=1, limiter=None):
     for attempt in range(retries):
+        retry_after = None
         try:
-            response = requests.get(url, timeout=10)
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                response = requests.get(url, timeout=10)
+            finally:
+                if limiter is not None:
+                    limiter.release()
+            throttled = response.status_code == 429 or response.status_code >= 500
+            if throttled:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if limiter is not None:
+                    limiter.on_throttle(retry_after)
             response.raise_for_status()
+            if limiter is not None:
+                limiter.on_success()
             return response
         except Exception:
             if attempt < retries - 1:
-                time.sleep(wait)
+                time.sleep(max(retry_after or 0, backoff_delay(attempt, wait)))
             else:
                 raise
 
@@ -28,58 +104,524 @@ def extract_plp_urls(products):
     return urls
 
 
-def extract_product_data(pdp_url):
-    dkp_number = pdp_url.rstrip("/").split("-")[-1]
-    api_url = f"https://api.digikala.com/v2/product/{dkp_number}/"
-    resp = safe_request(api_url)
-    product = resp.json()["data"]["product"]
-    title = product.get("title_fa")
-    attributes = []
-    try:
-        attributes = [
-            {attr.get("title"): attr.get("values")}
-            for attr in product.get("specifications")[0].get("attributes")
-        ]
-    except Exception:
-        pass
-    return {"title": title, "attributes": attributes, "url": pdp_url}
+def extract_product_data(pdp_url, limiter=None, cache=None, force_refresh=False):
+    dkp_number = dkp_from_url(pdp_url)
+    if cache is not None and not force_refresh:
+        cached = cache.get(dkp_number)
+        if cached is not None:
+            return ProductRecord.from_dict(dkp_number, cached, cached=True)
 
+    api_url = API_BASE_URL + PDP_PATH.format(dkp=dkp_number)
+    resp = safe_request(api_url, limiter=limiter)
+    product = parse_product(resp.content, dkp_number)
+    if cache is not None:
+        cache.set(dkp_number, product.projection())
+    return product
 
-def generate(category_url):
-    try:
-        category = category_url.split("/")[-2].split("-", 1)[1]
-        seen_urls = set()
-        PLP_URL = f"https://api.digikala.com/v1/categories/{category}/search/?page="
 
-        page = 1
-        while True:
-            resp = safe_request(PLP_URL + str(page))
+def _put(q, item, stop):
+    # blocking put that gives up once the consumer has gone away
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+
+def _plp_producer(cursors, limiter, pages, events, stop):
+    """Listing-page stage: runs ahead of the PDP stage by at most PLP_LOOKAHEAD pages.
+
+    Categories take turns page by page (round robin), so one huge category
+    cannot starve the others; `cursors` maps each category to the last page
+    that needs no fetching.
+    """
+    try:
+        turns = deque((category, cursor + 1) for category, cursor in cursors.items())
+        while turns and not stop.is_set():
+            category, page = turns.popleft()
+            resp = safe_request(
+                API_BASE_URL + PLP_PATH.format(category=category, page=page),
+                limiter=limiter,
+            )
             data = resp.json()["data"]
             urls = extract_plp_urls(data["products"])
+            total_pages = data["pager"]["total_pages"]
+            events.put(
+                {
+                    "type": "PLP_PROGRESS",
+                    "category": category,
+                    "page": page,
+                    "total_pages": total_pages,
+                    "urls": urls,
+                    "lookahead": pages.qsize(),
+                }
+            )
+            _put(pages, (category, page, urls), stop)
+            if page < total_pages:
+                turns.append((category, page + 1))
+    except Exception as e:
+        events.put({"type": "ERROR", "msg": str(e)})
+    finally:
+        _put(pages, None, stop)
+
+
+_job_runs = {}
+_job_runs_lock = threading.Lock()
+
 
-            yield f"data: {json.dumps({'type': 'PLP_PROGRESS', 'page': page, 'total_pages': data['pager']['total_pages'], 'urls': urls})}\n\n"
+def _claim_job(job_id):
+    """Take over a job from a generator that may still serve a dropped connection."""
+    with _job_runs_lock:
+        lock, previous_stop = _job_runs.get(job_id, (threading.Lock(), None))
+        if previous_stop is not None:
+            previous_stop.set()
+        stop = threading.Event()
+        _job_runs[job_id] = (lock, stop)
+    if not lock.acquire(timeout=30):
+        raise RuntimeError(f"job {job_id} is still running")
+    return lock, stop
+
+
+_aggregators = OrderedDict()
+_aggregators_lock = threading.Lock()
+
+
+def _logged_products(checkpoint):
+    for _, event in checkpoint.iter_events():
+        if event["type"] in PRODUCT_EVENTS:
+            url = event["data"]["url"]
+            yield ProductRecord.from_dict(dkp_from_url(url), event["data"])
+
+
+def _rebuild_aggregator(checkpoint):
+    aggregator = AttributeAggregator()
+    for product in _logged_products(checkpoint):
+        aggregator.add(product)
+    return aggregator
+
+
+def _keep_aggregator(job_id, aggregator):
+    with _aggregators_lock:
+        _aggregators[job_id] = aggregator
+        _aggregators.move_to_end(job_id)
+        while len(_aggregators) > KEPT_AGGREGATORS:
+            _aggregators.popitem(last=False)
+
+
+def attribute_summary(job_id):
+    """Attribute schema of a job, live while it runs; None for unknown jobs."""
+    with _aggregators_lock:
+        aggregator = _aggregators.get(job_id)
+    if aggregator is None:
+        checkpoint = ScrapeCheckpoint.load(job_id)
+        if checkpoint is None:
+            return None
+        aggregator = _rebuild_aggregator(checkpoint)
+        _keep_aggregator(job_id, aggregator)
+    return aggregator.summary()
+
+
+def _finish_delta(snapshots, hashes, seen, quarantined, changes, emit):
+    """Emit REMOVED products and replace the category snapshots of a delta scrape."""
+    for category, snapshot in snapshots.items():
+        current = hashes.setdefault(category, {})
+        for dkp, content_hash in snapshot.load().items():
+            if dkp not in seen:
+                changes["removed"] += 1
+                yield emit(
+                    {
+                        "type": "REMOVED",
+                        "category": category,
+                        "url": PRODUCT_URL.format(dkp=dkp),
+                    }
+                )
+            elif dkp in quarantined:
+                # not fetched this time; compare against the old hash next time
+                current.setdefault(dkp, content_hash)
+        snapshot.save(current)
+
+
+def scrape_events(
+    category_urls=None,
+    rate=REQUESTS_PER_SECOND,
+    workers=PDP_WORKERS,
+    force_refresh=False,
+    delta=False,
+    job_id=None,
+    last_event_id=0,
+):
+    """Run a scrape job over one or more categories, yielding (event_id, event) pairs.
+
+    With the `job_id` of an existing checkpoint the job is resumed: logged
+    events newer than `last_event_id` are replayed, then crawling continues
+    after each category's checkpointed page cursor, skipping products that
+    are done. A product listed in several categories is fetched once and
+    counted in the category it was first seen in.
+    Transient events (errors, limiter status, live attribute summaries) are
+    not logged and have no id.
+
+    A product that still fails after `safe_request`'s own retries does not
+    stop the crawl: it goes to a retry queue that is drained in
+    RETRY_ROUNDS passes at the end, and whatever fails all of them is
+    reported as quarantined in the final SUMMARY event.
+
+    A `delta` scrape compares each product's attribute hash with the
+    category snapshot of the previous delta scrape and only streams NEW and
+    CHANGED products, then the REMOVED ones; unchanged products are logged
+    as PDP_UNCHANGED for the checkpoint but never streamed. Product data is
+    always fetched fresh, and the snapshots are replaced when the job ends.
+    """
+    if isinstance(category_urls, str):
+        category_urls = [category_urls]
+    checkpoint = ScrapeCheckpoint.load(job_id) if job_id else None
+    if checkpoint is None:
+        checkpoint = ScrapeCheckpoint(
+            job_id or new_job_id(),
+            {
+                "category_urls": category_urls,
+                "force_refresh": force_refresh or delta,
+                "delta": delta,
+                "cursors": {category_slug(url): 0 for url in category_urls or ()},
+                "finished": False,
+            },
+        )
+        checkpoint.save()
+
+    def emit(event):
+        return checkpoint.append_event(event), event
+
+    try:
+        job_lock, stop = _claim_job(checkpoint.job_id)
+    except Exception as e:
+        yield None, {"type": "ERROR", "msg": str(e)}
+        return
 
-            for url in urls:
-                if url in seen_urls:
+    # everything below runs under the job lock, so failures must release it
+    pivot = executor = None
+    try:
+        limiter = AdaptiveRateLimiter(rate, concurrency=workers)
+        cache = get_product_cache()
+        aggregator = _rebuild_aggregator(checkpoint)
+        _keep_aggregator(checkpoint.job_id, aggregator)
+        pivot = AttributePivot(checkpoint.job_id)
+        if pivot.rows != aggregator.products:
+            # interrupted between the event log and the pivot; the log wins
+            pivot.reset()
+            for product in _logged_products(checkpoint):
+                pivot.add(product)
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+        for event_id, event in checkpoint.iter_events(after=last_event_id):
+            if event["type"] != "PDP_UNCHANGED":
+                yield event_id, event
+        if checkpoint.last_event_id == 0:
+            yield emit({"type": "JOB", "job_id": checkpoint.job_id})
+        if checkpoint.state["finished"]:
+            return
+
+        force_refresh = checkpoint.state["force_refresh"]
+        cursors = checkpoint.state["cursors"]
+        if not cursors:
+            raise ValueError("no category given")
+
+        events = queue.Queue()
+        pages = queue.Queue(maxsize=PLP_LOOKAHEAD)
+        threading.Thread(
+            target=_plp_producer,
+            args=(dict(cursors), limiter, pages, events, stop),
+            daemon=True,
+        ).start()
+
+        failed = dict(checkpoint.failed_urls)
+        seen = checkpoint.done_dkps
+        # counted before the retry queue's products join `seen`; they are
+        # counted as done when a retry succeeds
+        done = len(seen)
+        for url in failed:
+            seen.add(dkp_from_url(url))
+        progress = {
+            category: {"queued": 0, "done": 0, "duplicates": 0} for category in cursors
+        }
+        for category, count in checkpoint.done_by_category.items():
+            if category in progress:
+                progress[category]["queued"] += count
+                progress[category]["done"] += count
+        for category, _ in failed.values():
+            if category in progress:
+                progress[category]["queued"] += 1
+        pending = deque()
+        inflight = {}
+        # per category: listing pages in fetch order -> products not done yet
+        open_pages = {category: OrderedDict() for category in cursors}
+        plp_finished = False
+        queued = len(seen)
+        last_status, last_status_at = None, 0.0
+        delta = checkpoint.state.get("delta", False)
+        if delta:
+            snapshots = {category: CategorySnapshot(category) for category in cursors}
+            # products may move between categories; compare against all of them
+            previous_hashes = {}
+            for snapshot in snapshots.values():
+                previous_hashes.update(snapshot.load())
+            hashes = checkpoint.content_hashes
+            changes = Counter(
+                (
+                    "unchanged"
+                    if event["type"] == "PDP_UNCHANGED"
+                    else event["type"].lower()
+                )
+                for _, event in checkpoint.iter_events()
+                if event["type"] in ("NEW", "CHANGED", "PDP_UNCHANGED")
+            )
+            last_progress_at = 0.0
+
+        def product_done(category, product):
+            nonlocal done, last_progress_at
+            done += 1
+            progress[category]["done"] += 1
+            event = {
+                "type": "PDP_PROGRESS",
+                "category": category,
+                "data": product.to_dict(),
+                "done": done,
+                "queued": queued,
+                "category_done": progress[category]["done"],
+                "category_queued": progress[category]["queued"],
+            }
+            if delta:
+                content_hash = product.content_hash()
+                hashes.setdefault(category, {})[product.dkp] = content_hash
+                previous = previous_hashes.get(product.dkp)
+                if previous == content_hash:
+                    changes["unchanged"] += 1
+                    checkpoint.append_event(
+                        {
+                            "type": "PDP_UNCHANGED",
+                            "category": category,
+                            "url": product.url,
+                            "hash": content_hash,
+                        }
+                    )
+                    now = time.monotonic()
+                    if now - last_progress_at >= STATUS_INTERVAL_SECONDS:
+                        last_progress_at = now
+                        yield None, {"type": "PROGRESS", "done": done, "queued": queued}
+                    return
+                event["type"] = "NEW" if previous is None else "CHANGED"
+                event["hash"] = content_hash
+                changes[event["type"].lower()] += 1
+            yield emit(event)
+            aggregator.add(product)
+            pivot.add(product)
+            if aggregator.products % ATTRIBUTES_EVERY == 0:
+                yield None, {"type": "ATTRIBUTES", **aggregator.summary()}
+
+        while not stop.is_set():
+            # feed the PDP stage, keeping at most 2x workers requests in flight
+            while len(inflight) < workers * 2:
+                if pending:
+                    category, page, url = pending.popleft()
+                    future = executor.submit(
+                        extract_product_data, url, limiter, cache, force_refresh
+                    )
+                    inflight[future] = (category, page, url)
                     continue
-                seen_urls.add(url)
+                if plp_finished:
+                    break
                 try:
-                    time.sleep(0.5)
-                    product = extract_product_data(url)
-                    yield f"data: {json.dumps({'type': 'PDP_PROGRESS', 'data': product})}\n\n"
-                except Exception as e:
-                    yield f"data: {json.dumps({'type': 'ERROR', 'msg': str(e)})}\n\n"
-                    time.sleep(5)
+                    item = pages.get(block=not inflight, timeout=0.5)
+                except queue.Empty:
+                    break
+                if item is None:
+                    plp_finished = True
+                    break
+                category, page, urls = item
+                open_pages[category][page] = 0
+                for url in urls:
+                    if seen.add(dkp_from_url(url)):
+                        pending.append((category, page, url))
+                        open_pages[category][page] += 1
+                        progress[category]["queued"] += 1
+                        queued += 1
+                    else:
+                        progress[category]["duplicates"] += 1
+
+            while not events.empty():
+                event = events.get_nowait()
+                if event["type"] == "ERROR":
+                    yield None, event
                     return
+                if event["type"] == "PLP_PROGRESS":
+                    event.update(
+                        {
+                            f"category_{key}": value
+                            for key, value in progress[event["category"]].items()
+                        }
+                    )
+                yield emit(event)
+
+            # current request budget of the adaptive limiter (not checkpointed)
+            status = limiter.snapshot()
+            now = time.monotonic()
+            if (
+                status != last_status
+                and now - last_status_at >= STATUS_INTERVAL_SECONDS
+            ):
+                last_status, last_status_at = status, now
+                yield None, {"type": "STATUS", **status}
 
-            if page >= data["pager"]["total_pages"]:
+            # advance each category's cursor past the leading pages whose
+            # products are all done
+            moved = False
+            for category, category_pages in open_pages.items():
+                while category_pages and next(iter(category_pages.values())) == 0:
+                    cursors[category], _ = category_pages.popitem(last=False)
+                    moved = True
+            if moved:
+                checkpoint.save()
+
+            if not inflight:
+                if plp_finished and not pending:
+                    break
+                continue
+
+            finished, _ = wait(inflight, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in finished:
+                category, page, url = inflight.pop(future)
+                open_pages[category][page] -= 1
+                try:
+                    product = future.result()
+                except Exception as e:
+                    failed[url] = (category, str(e))
+                    yield emit(
+                        {
+                            "type": "PDP_FAILED",
+                            "category": category,
+                            "url": url,
+                            "error": str(e),
+                        }
+                    )
+                    continue
+                yield from product_done(category, product)
+
+        retried = len(failed)
+        for round_number in range(RETRY_ROUNDS):
+            if not failed or stop.is_set():
+                break
+            delay = RETRY_BASE_SECONDS * 2**round_number
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            yield None, {
+                "type": "RETRY",
+                "round": round_number + 1,
+                "rounds": RETRY_ROUNDS,
+                "pending": len(failed),
+                "delay": round(delay, 1),
+            }
+            if stop.wait(delay):
                 break
-            page += 1
+            futures = {
+                executor.submit(
+                    extract_product_data, url, limiter, cache, force_refresh
+                ): url
+                for url in failed
+            }
+            for future in as_completed(futures):
+                url = futures[future]
+                category = failed[url][0]
+                try:
+                    product = future.result()
+                except Exception as e:
+                    failed[url] = (category, str(e))
+                    continue
+                del failed[url]
+                yield from product_done(category, product)
 
-        yield f"data: {json.dumps({'type': 'DONE'})}\n\n"
+        if stop.is_set():
+            return
+        checkpoint.state["finished"] = True
+        checkpoint.save()
+        if delta:
+            quarantined = {dkp_from_url(url) for url in failed}
+            yield from _finish_delta(
+                snapshots, hashes, seen, quarantined, changes, emit
+            )
+        yield emit({"type": "ATTRIBUTES", **aggregator.summary()})
+        yield emit(
+            {
+                "type": "SUMMARY",
+                "done": done,
+                "queued": queued,
+                "retried": retried,
+                "categories": progress,
+                **({"changes": changes} if delta else {}),
+                "quarantined": [
+                    {"url": url, "category": category, "error": error}
+                    for url, (category, error) in failed.items()
+                ],
+            }
+        )
+        yield emit({"type": "DONE"})
 
     except Exception as e:
-        yield f"data: {json.dumps({'type': 'ERROR', 'msg': str(e)})}\n\n"
+        yield None, {"type": "ERROR", "msg": str(e)}
+    finally:
+        # also runs when the client disconnects and the generator is closed
+        stop.set()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        checkpoint.close()
+        if pivot is not None:
+            pivot.close()
+        job_lock.release()
+
+
+def generate(category_urls=None, job_id=None, last_event_id=0, **options):
+    """SSE generator running a scrape inline (see `scrape_events`)."""
+    for event_id, event in scrape_events(
+        category_urls, job_id=job_id, last_event_id=last_event_id, **options
+    ):
+        yield sse(event, event_id)
+
+
+def _single_flight_key(category_urls, options):
+    # identical scrapes started while one is in flight share its crawl
+    try:
+        categories = sorted({category_slug(url) for url in category_urls or ()})
+    except IndexError:
+        return None
+    if not categories:
+        return None
+    return "digikala_scrape:{}:{}:{}".format(
+        ",".join(categories),
+        bool(options.get("force_refresh")),
+        bool(options.get("delta")),
+    )
+
+
+def submit_job(category_urls=None, job_id=None, **options):
+    """Run a scrape as a background job; an existing job id resumes its checkpoint.
+
+    A new scrape of the same categories as one still in flight joins that
+    job instead of crawling Digikala a second time.
+    """
+    key = None if job_id else _single_flight_key(category_urls, options)
+    job_id = job_id or new_job_id()
+
+    def run():
+        # logged events stay in the checkpoint log; the job keeps their ids,
+        # which are also their SSE ids
+        for event_id, event in scrape_events(category_urls, job_id=job_id, **options):
+            yield event if event_id is None else event_id
+
+    return jobs.submit(
+        "digikala_scrape",
+        run,
+        params={"category_urls": category_urls, **options},
+        job_id=job_id,
+        key=key,
+        load_events=EventLogReader(job_id).read,
+    )
 
 
 html = """
@@ -95,13 +637,15 @@ html = """
         body { font-family: 'Vazirmatn', Arial; direction: rtl; text-align: right; margin: 20px; background: #f5f5f5; }
         h1 { color: purple; text-align: center; margin-bottom: 5px; }
         .title-line { width: 50%; height: 4px; background: purple; border-radius: 20px; margin: 0 auto 20px auto; }
-        input { padding: 10px; font-size: 16px; border-radius: 5px; border: 1px solid #ccc; width: 70%; }
+        input, textarea { padding: 10px; font-size: 16px; border-radius: 5px; border: 1px solid #ccc; width: 70%; font-family: inherit; }
+        textarea { direction: ltr; text-align: left; }
         button { padding: 10px 20px; font-size: 16px; border-radius: 5px; border: none; background: purple; color: white; cursor: pointer; margin-top: 10px; }
         button:hover { background: #800080; }
         .progress-container { margin-bottom: 20px; }
         progress { width: 100%; height: 25px; border-radius: 5px; }
         #log { max-height: 400px; overflow-y: auto; border: 1px solid #ccc; padding: 10px; background: white; border-radius: 5px; }
         .error { background: #ffcccc; border-radius: 8px; padding: 10px; margin: 8px 0; }
+        .warning { background: #fff4cc; border-radius: 8px; padding: 10px; margin: 8px 0; }
         .container { max-width: 1000px; margin: auto; padding: 20px; background: white; border-radius: 10px; box-shadow: 0 0 15px rgba(0,0,0,0.1); }
         table { width: 100%; border-collapse: collapse; margin-top: 10px; }
         th, td { border: 1px solid #ccc; padding: 8px; text-align: right; }
@@ -115,25 +659,37 @@ html = """
       <div class="title-line"></div>
 
       <div class="container">
-        <input type="text" id="category" placeholder="لینک دسته‌بندی دیجی‌کالا را وارد کنید">
+        <textarea id="category" rows="3" placeholder="لینک دسته‌بندی‌های دیجی‌کالا (هر خط یک لینک)"></textarea>
         <button onclick="startScrape()">شروع اسکریپ</button>
+        <label><input type="checkbox" id="force-refresh" style="width: auto;"> دریافت مجدد همه محصولات (بدون کش)</label>
+        <label><input type="checkbox" id="delta" style="width: auto;"> فقط تغییرات نسبت به اسکریپ قبلی (جدید، تغییر یافته، حذف شده)</label>
+        <br>
+        <input type="text" id="job-id" placeholder="شناسه اسکریپ قبلی برای ادامه" style="width: 40%;">
+        <button onclick="startScrape(document.getElementById('job-id').value.trim())">ادامه اسکریپ</button>
 
         <div class="progress-container">
           <h3>در حال یافتن محصولات...</h3>
           <progress id="plp-bar" value="0" max="1"></progress>
           <span id="plp-text"></span>
+          <table id="category-table">
+            <thead>
+              <tr><th>دسته‌بندی</th><th>صفحات</th><th>محصولات پردازش‌شده</th><th>تکراری</th></tr>
+            </thead>
+            <tbody></tbody>
+          </table>
         </div>
 
         <div class="progress-container">
-          <h3>در حال پردازش محصولات صفحه جاری...</h3>
+          <h3>در حال پردازش محصولات...</h3>
           <progress id="pdp-bar" value="0" max="1"></progress>
           <span id="pdp-text"></span>
+          <div id="rate-text"></div>
         </div>
 
-        <h3>ویژگی‌های جدید یافته شده:</h3>
+        <h3>ویژگی‌های یافته شده (<span id="attributes-products">0</span> محصول):</h3>
         <table id="new-attributes-table">
           <thead>
-            <tr><th>ویژگی</th><th>مثال</th></tr>
+            <tr><th>ویژگی</th><th>پوشش</th><th>مقادیر متمایز</th><th>پرتکرارترین مقادیر</th></tr>
           </thead>
           <tbody></tbody>
         </table>
@@ -151,18 +707,32 @@ html = """
             <tbody id="product-body"></tbody>
           </table>
         </div>
+
+        <div id="summary"></div>
+        <div id="downloads"></div>
       </div>
 
       <script>
       let stoppedDueToError = false;
       let evtSource = null;
-      let seenAttributes = new Set();
 
-      function startScrape() {
+      // one row per category: pages, products done / queued and cross-category duplicates
+      function categoryRow(category) {
+          const tbody = document.querySelector("#category-table tbody");
+          let row = tbody.querySelector(`tr[data-category="${category}"]`);
+          if(!row) {
+              row = document.createElement("tr");
+              row.dataset.category = category;
+              row.innerHTML = `<td>${category}</td><td class="pages"></td><td class="products"></td><td class="duplicates">0</td>`;
+              tbody.appendChild(row);
+          }
+          return row;
+      }
+
+      function startScrape(resumeJobId) {
           if(evtSource) { evtSource.close(); evtSource = null; }
 
           stoppedDueToError = false;
-          seenAttributes = new Set();
           const category = document.getElementById("category").value;
           const plpBar = document.getElementById("plp-bar");
           const plpText = document.getElementById("plp-text");
@@ -171,71 +741,148 @@ html = """
           const tbody = document.getElementById("product-body");
           tbody.innerHTML = "";
           document.querySelector("#new-attributes-table tbody").innerHTML = "";
+          document.querySelector("#category-table tbody").innerHTML = "";
+          document.getElementById("summary").innerHTML = "";
+          document.getElementById("downloads").innerHTML = "";
+          document.querySelectorAll("#log .warning").forEach(el => el.remove());
           plpBar.value = 0; pdpBar.value = 0;
           plpText.innerText = ""; pdpText.innerText = "";
 
-          evtSource = new EventSource("/scrape?category_url=" + encodeURIComponent(category));
-
-          evtSource.onmessage = function(e) {
-              const msg = JSON.parse(e.data);
-              if(stoppedDueToError) return;
-
-              if(msg.type=="PLP_PROGRESS") {
-                  plpBar.max = msg.total_pages;
-                  plpBar.value = msg.page;
-                  plpText.innerText = `صفحه ${msg.page} از ${msg.total_pages} بارگذاری شد (${msg.urls.length} محصول)`;
-
-                  // --------------------- هر صفحه PDP bar از صفر شروع شود ---------------------
-                  pdpBar.max = msg.urls.length;
-                  pdpBar.value = 0;
-                  pdpText.innerText = `0 / ${pdpBar.max} محصولات پردازش شد`;
-              }
-              else if(msg.type=="PDP_PROGRESS") {
-                  pdpBar.value += 1;
-                  pdpText.innerText = `${pdpBar.value} / ${pdpBar.max} محصول پردازش شد`;
-
-                  const tr = document.createElement("tr");
-                  const attrs = msg.data.attributes
-                                .map(a => Object.entries(a)
-                                .map(([k,v]) => `${k}: ${v.join(", ")}`)
-                                .join("<br>"))
-                                .join("<hr>");
-                  tr.innerHTML = `<td>${msg.data.title}</td><td>${attrs}</td><td><a href="${msg.data.url}" target="_blank">مشاهده</a></td>`;
-                  tbody.appendChild(tr);
-
-                  const attrTbody = document.querySelector("#new-attributes-table tbody");
-                  msg.data.attributes.forEach(a => {
-                      Object.entries(a).forEach(([attrName, values]) => {
-                          if(!seenAttributes.has(attrName)) {
-                              seenAttributes.add(attrName);
-                              const trAttr = document.createElement("tr");
-                              trAttr.innerHTML = `<td>${attrName}</td><td>${values[0] || ""}</td>`;
-                              attrTbody.appendChild(trAttr);
-                          }
-                      });
-                  });
-              }
-              else if(msg.type=="ERROR") {
-                  stoppedDueToError = true;
-                  const logDiv = document.getElementById("log");
-                  const div = document.createElement("div");
-                  div.classList.add("error");
-                  div.innerText = `خطا: ${msg.msg}`;
-                  logDiv.prepend(div);
-                  pdpText.innerText = "اسکریپت متوقف شد! لطفا دوباره لینک وارد کنید.";
-                  if(evtSource) { evtSource.close(); evtSource = null; }
-              }
-              else if(msg.type=="DONE") {
-                  pdpText.innerText = "تمام شد!";
-                  if(evtSource) { evtSource.close(); evtSource = null; }
-              }
-          };
-
-          evtSource.onerror = function() {
-              stoppedDueToError = true;
-              if(evtSource) { evtSource.close(); evtSource = null; }
-              pdpText.innerText = "کاربر مرورگر را بسته یا صفحه را ترک کرد، اسکریپت متوقف شد.";
-          };
+          // the crawl runs as a background job; this page only subscribes to its events
+          const jobIdInput = document.getElementById("job-id");
+          const body = new URLSearchParams();
+          if(resumeJobId) {
+              body.set("job_id", resumeJobId);
+          } else {
+              category.split("\n").map(url => url.trim()).filter(url => url)
+                  .forEach(url => body.append("category_url", url));
+              body.set("force_refresh", document.getElementById("force-refresh").checked ? "1" : "0");
+              body.set("delta", document.getElementById("delta").checked ? "1" : "0");
+          }
+          fetch("/scrape/jobs", { method: "POST", body: body })
+              .then(r => r.json().then(data => [r.ok, data]))
+              .then(([ok, data]) => {
+                  if(!ok) { pdpText.innerText = `خطا: ${data.error}`; return; }
+                  jobIdInput.value = data.job_id;
+                  subscribe(data.job_id);
+              })
+              .catch(() => { pdpText.innerText = "خطا در ارتباط با سرور"; });
+
+          function subscribe(jobId) {
+          evtSource = new EventSource(`/jobs/${encodeURIComponent(jobId)}/events`);
+          const exportUrl = `/scrape/jobs/${encodeURIComponent(jobId)}/export`;
+          document.getElementById("downloads").innerHTML =
+              `<h3>دانلود محصولات اسکریپ‌شده:</h3>` +
+              `<a href="${exportUrl}.csv">CSV</a> | <a href="${exportUrl}.xlsx">XLSX</a> | <a href="${exportUrl}.parquet">Parquet</a>`;
+
+              evtSource.onmessage = function(e) {
+                  const msg = JSON.parse(e.data);
+                  if(stoppedDueToError) return;
+
+                  if(msg.type=="JOB") {
+                      jobIdInput.value = msg.job_id;
+                  }
+                  else if(msg.type=="STATUS") {
+                      document.getElementById("rate-text").innerText =
+                          `سرعت فعلی: ${msg.rate} درخواست در ثانیه، ${msg.concurrency} درخواست همزمان (${msg.throttled} بار محدود شد)`;
+                  }
+                  else if(msg.type=="PLP_PROGRESS") {
+                      plpBar.max = msg.total_pages;
+                      plpBar.value = msg.page;
+                      plpText.innerText = `${msg.category}: صفحه ${msg.page} از ${msg.total_pages} بارگذاری شد (${msg.urls.length} محصول، ${msg.lookahead} صفحه در صف)`;
+                      const row = categoryRow(msg.category);
+                      row.querySelector(".pages").innerText = `${msg.page} / ${msg.total_pages}`;
+                      row.querySelector(".duplicates").innerText = msg.category_duplicates;
+                  }
+                  else if(msg.type=="PROGRESS") {
+                      // delta scrapes: unchanged products are only counted
+                      pdpBar.max = msg.queued;
+                      pdpBar.value = msg.done;
+                      pdpText.innerText = `${msg.done} / ${msg.queued} محصول پردازش شد`;
+                  }
+                  else if(msg.type=="PDP_PROGRESS" || msg.type=="NEW" || msg.type=="CHANGED") {
+                      // --------------------- PDP bar برای کل محصولات صف‌شده ---------------------
+                      pdpBar.max = msg.queued;
+                      pdpBar.value = msg.done;
+                      pdpText.innerText = `${msg.done} / ${msg.queued} محصول پردازش شد`;
+                      categoryRow(msg.category).querySelector(".products").innerText =
+                          `${msg.category_done} / ${msg.category_queued}`;
+
+                      const tr = document.createElement("tr");
+                      const attrs = msg.data.attributes
+                                    .map(a => Object.entries(a)
+                                    .map(([k,v]) => `${k}: ${v.join(", ")}`)
+                                    .join("<br>"))
+                                    .join("<hr>");
+                      const badge = {NEW: "[جدید] ", CHANGED: "[تغییر یافته] "}[msg.type] || "";
+                      tr.innerHTML = `<td>${badge}${msg.data.title}</td><td>${attrs}</td><td><a href="${msg.data.url}" target="_blank">مشاهده</a></td>`;
+                      tbody.appendChild(tr);
+                  }
+                  else if(msg.type=="REMOVED") {
+                      const tr = document.createElement("tr");
+                      tr.innerHTML = `<td>[حذف شده]</td><td>${msg.category}</td><td><a href="${msg.url}" target="_blank">مشاهده</a></td>`;
+                      tbody.appendChild(tr);
+                  }
+                  else if(msg.type=="ATTRIBUTES") {
+                      // attribute schema is aggregated on the server
+                      document.getElementById("attributes-products").innerText = msg.products;
+                      document.querySelector("#new-attributes-table tbody").innerHTML = msg.attributes
+                          .map(a => `<tr><td>${a.name}</td><td>${Math.round(a.coverage * 100)}٪</td>` +
+                                    `<td>${a.distinct_exact ? "" : "~"}${a.distinct}</td>` +
+                                    `<td>${a.top_values.map(([v, c]) => `${v} (${c})`).join("، ")}</td></tr>`)
+                          .join("");
+                  }
+                  else if(msg.type=="PDP_FAILED") {
+                      const div = document.createElement("div");
+                      div.classList.add("warning");
+                      div.innerText = `خطا در دریافت ${msg.url} (در پایان دوباره تلاش می‌شود): ${msg.error}`;
+                      document.getElementById("log").prepend(div);
+                  }
+                  else if(msg.type=="RETRY") {
+                      pdpText.innerText = `تلاش مجدد ${msg.round} از ${msg.rounds} برای ${msg.pending} محصول ناموفق (پس از ${msg.delay} ثانیه)...`;
+                  }
+                  else if(msg.type=="SUMMARY") {
+                      const summary = document.getElementById("summary");
+                      summary.innerHTML = `<h3>خلاصه:</h3><p>${msg.done} از ${msg.queued} محصول دریافت شد، ${msg.retried} محصول دوباره تلاش شد، ${msg.quarantined.length} محصول قرنطینه شد.</p>`;
+                      if(msg.changes) {
+                          const c = msg.changes;
+                          summary.innerHTML += `<p>${c.new || 0} جدید، ${c.changed || 0} تغییر یافته، ${c.removed || 0} حذف شده، ${c.unchanged || 0} بدون تغییر</p>`;
+                      }
+                      if(msg.quarantined.length) {
+                          const rows = msg.quarantined
+                              .map(q => `<tr><td><a href="${q.url}" target="_blank">${q.url}</a></td><td>${q.error}</td></tr>`)
+                              .join("");
+                          summary.innerHTML += `<table><thead><tr><th>محصول قرنطینه‌شده</th><th>خطا</th></tr></thead><tbody>${rows}</tbody></table>`;
+                      }
+                  }
+                  else if(msg.type=="ERROR") {
+                      stoppedDueToError = true;
+                      const logDiv = document.getElementById("log");
+                      const div = document.createElement("div");
+                      div.classList.add("error");
+                      div.innerText = `خطا: ${msg.msg}`;
+                      logDiv.prepend(div);
+                      pdpText.innerText = "اسکریپت متوقف شد! لطفا دوباره لینک وارد کنید.";
+                      if(evtSource) { evtSource.close(); evtSource = null; }
+                  }
+                  else if(msg.type=="DONE") {
+                      pdpText.innerText = "تمام شد!";
+                      if(evtSource) { evtSource.close(); evtSource = null; }
+                  }
+              };
+
+              evtSource.onerror = function() {
+                  // EventSource reconnects by itself and sends Last-Event-ID, so only
+                  // missed events are replayed; it gives up when the state is CLOSED
+                  if(evtSource && evtSource.readyState === EventSource.CLOSED) {
+                      stoppedDueToError = true;
+                      evtSource = null;
+                      pdpText.innerText = `ارتباط قطع شد. برای ادامه از شناسه ${jobIdInput.value} استفاده کنید.`;
+                  } else {
+                      pdpText.innerText = "ارتباط قطع شد، در حال اتصال مجدد...";
+                  }
+              };
+          }
       }
       </script>
     </body>
@@ -0,0 +1,137 @@
+import hashlib
+import math
+import threading
+
+EXACT_DISTINCT_LIMIT = 256  # distinct values kept verbatim before switching to HLL
+HLL_PRECISION = 10  # 1024 registers, ~3% standard error
+TOP_K_CAPACITY = 50  # counters per attribute in the Space-Saving sketch
+TOP_N = 10
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big"
+    )
+
+
+class HyperLogLog:
+    """Fixed-size (2**precision bytes) distinct-count estimator."""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+
+    def add(self, value: str) -> None:
+        h = _hash64(value)
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self) -> int:
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small sets
+        return round(estimate)
+
+
+class SpaceSaving:
+    """Top-k heavy hitters in `capacity` counters; exact while distinct <= capacity."""
+
+    def __init__(self, capacity: int = TOP_K_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        self.overflowed = False
+
+    def add(self, value: str) -> None:
+        if value in self.counts:
+            self.counts[value] += 1
+        elif len(self.counts) < self.capacity:
+            self.counts[value] = 1
+        else:
+            # replace the minimum; its count is an upper bound for the newcomer
+            self.overflowed = True
+            victim = min(self.counts, key=self.counts.get)
+            self.counts[value] = self.counts.pop(victim) + 1
+
+    def top(self, n: int) -> list:
+        return sorted(self.counts.items(), key=lambda item: -item[1])[:n]
+
+
+class AttributeStats:
+    __slots__ = ("products", "values", "exact", "hll", "top")
+
+    def __init__(self):
+        self.products = 0
+        self.values = 0
+        self.exact = set()
+        self.hll = None
+        self.top = SpaceSaving()
+
+    def add_values(self, values) -> None:
+        self.products += 1
+        for value in values:
+            value = str(value)
+            self.values += 1
+            self.top.add(value)
+            if self.hll is not None:
+                self.hll.add(value)
+                continue
+            self.exact.add(value)
+            if len(self.exact) > EXACT_DISTINCT_LIMIT:
+                self.hll = HyperLogLog()
+                for seen in self.exact:
+                    self.hll.add(seen)
+                self.exact = set()
+
+    def distinct(self) -> int:
+        return self.hll.count() if self.hll is not None else len(self.exact)
+
+
+class AttributeAggregator:
+    """Incremental attribute schema of a scraped category.
+
+    Tracks, per attribute name, how many products have it, how many distinct
+    values it takes and its most frequent values. Memory per attribute is
+    bounded: distinct values are kept verbatim only up to
+    EXACT_DISTINCT_LIMIT, then estimated with HyperLogLog, and top values come
+    from a Space-Saving sketch of TOP_K_CAPACITY counters.
+    """
+
+    def __init__(self):
+        self.products = 0
+        self.attributes = {}
+        self._lock = threading.Lock()
+
+    def add(self, record) -> None:
+        with self._lock:
+            self.products += 1
+            for name, values in record.attributes:
+                stats = self.attributes.get(name)
+                if stats is None:
+                    stats = self.attributes[name] = AttributeStats()
+                stats.add_values(values)
+
+    def summary(self, top_n: int = TOP_N) -> dict:
+        with self._lock:
+            attributes = [
+                {
+                    "name": name,
+                    "products": stats.products,
+                    "coverage": round(stats.products / self.products, 4),
+                    "values": stats.values,
+                    "distinct": stats.distinct(),
+                    "distinct_exact": stats.hll is None,
+                    "top_values": stats.top.top(top_n),
+                    "top_exact": not stats.top.overflowed,
+                }
+                for name, stats in self.attributes.items()
+            ]
+            products = self.products
+        attributes.sort(key=lambda attribute: -attribute["products"])
+        return {"products": products, "attributes": attributes}
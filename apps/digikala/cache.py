@@ -0,0 +1,91 @@
+import json
+import sqlite3
+import threading
+import time
+
+from apps.common.storage import data_path
+
+CACHE_TTL_SECONDS = 30 * 24 * 3600  # product specs rarely change
+CACHE_MAX_ENTRIES = 200_000
+EVICT_EVERY = 500  # writes between LRU eviction passes
+
+
+class ProductCache:
+    """Persistent DKP -> projected product cache (SQLite) with TTL and LRU eviction.
+
+    Only the projected result (title, attributes) is stored, never the raw
+    API payload. The connection is shared between the PDP workers behind a
+    lock; reads refresh `accessed_at` so eviction drops the least recently
+    used products first.
+    """
+
+    def __init__(self, path=None, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(
+            path or data_path("digikala", "product_cache.sqlite3"),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS products ("
+            " dkp INTEGER PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS products_accessed ON products (accessed_at)"
+        )
+
+    def get(self, dkp: int) -> dict | None:
+        """Return the cached product, or None when missing or older than the TTL."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, fetched_at FROM products WHERE dkp = ?", (dkp,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                return None
+            self._conn.execute(
+                "UPDATE products SET accessed_at = ? WHERE dkp = ?", (now, dkp)
+            )
+        return json.loads(row[0])
+
+    def set(self, dkp: int, product: dict) -> None:
+        now = time.time()
+        payload = json.dumps(product, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?)",
+                (dkp, payload, now, now),
+            )
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._evict()
+
+    def _evict(self) -> None:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM products").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM products WHERE dkp IN ("
+                " SELECT dkp FROM products ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            )
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_product_cache() -> ProductCache:
+    """Process-wide cache instance, opened on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ProductCache()
+        return _default_cache
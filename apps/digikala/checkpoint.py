@@ -0,0 +1,170 @@
+import json
+import os
+import re
+import threading
+import uuid
+from array import array
+from collections import Counter
+
+from apps.common.storage import data_path
+from apps.digikala.records import DkpSet, category_slug, dkp_from_url
+
+_JOB_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# logged events marking a product as done; delta scrapes log NEW / CHANGED
+# products and a PDP_UNCHANGED event (never streamed) for the rest
+DONE_EVENTS = ("PDP_PROGRESS", "NEW", "CHANGED", "PDP_UNCHANGED")
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+def valid_job_id(job_id: str | None) -> bool:
+    return bool(job_id) and bool(_JOB_ID_RE.match(job_id))
+
+
+class ScrapeCheckpoint:
+    """Local checkpoint of one scrape job.
+
+    `state.json` holds the job parameters and a page cursor per category
+    (the last listing page whose products are all done) and is rewritten
+    atomically. `events.jsonl` is the append-only SSE event log; an event's
+    id is its 1-based line number, which is what clients send back as
+    Last-Event-ID, also when the job is run again. Transient events are not
+    logged and are streamed without an id. Completed and failed products are recovered from the
+    PDP_PROGRESS / PDP_FAILED events of the log, so they never have to be
+    rewritten as a whole.
+    """
+
+    def __init__(self, job_id: str, state: dict | None = None):
+        if not valid_job_id(job_id):
+            raise ValueError(f"invalid job id: {job_id!r}")
+        self.job_id = job_id
+        self.state_path = data_path("digikala", "jobs", job_id, "state.json")
+        self.events_path = data_path("digikala", "jobs", job_id, "events.jsonl")
+        self.state = state or {"cursors": {}, "finished": False}
+        self.done_dkps = DkpSet()
+        self.done_by_category = Counter()
+        self.failed_urls = {}  # url -> (category, last error), for the retry queue
+        self.content_hashes = {}  # category -> {dkp: attribute hash}, delta scrapes
+        self.last_event_id = 0
+        self._log = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, job_id: str) -> "ScrapeCheckpoint | None":
+        if not valid_job_id(job_id):
+            return None
+        checkpoint = cls(job_id)
+        if not os.path.exists(checkpoint.state_path):
+            return None
+        with open(checkpoint.state_path, encoding="utf-8") as f:
+            checkpoint.state = json.load(f)
+        default_category = checkpoint._upgrade_state()
+        checkpoint._drop_partial_event()
+        for _, event in checkpoint.iter_events():
+            checkpoint.last_event_id += 1
+            if event.get("type") in DONE_EVENTS:
+                url = event["data"]["url"] if "data" in event else event["url"]
+                dkp = dkp_from_url(url)
+                category = event.get("category", default_category)
+                checkpoint.done_dkps.add(dkp)
+                checkpoint.done_by_category[category] += 1
+                checkpoint.failed_urls.pop(url, None)
+                if "hash" in event:
+                    hashes = checkpoint.content_hashes.setdefault(category, {})
+                    hashes[dkp] = event["hash"]
+            elif event.get("type") == "PDP_FAILED":
+                checkpoint.failed_urls[event["url"]] = (
+                    event.get("category", default_category),
+                    event["error"],
+                )
+        return checkpoint
+
+    def _upgrade_state(self) -> str | None:
+        # checkpoints of single-category jobs have one "cursor"; their logged
+        # events carry no category, so they belong to that one
+        if "category_url" not in self.state:
+            return None
+        category_url = self.state.pop("category_url")
+        category = category_slug(category_url)
+        self.state["category_urls"] = [category_url]
+        self.state["cursors"] = {category: self.state.pop("cursor", 0)}
+        return category
+
+    def _drop_partial_event(self) -> None:
+        # a crash mid-write can leave a truncated last line; later appends
+        # would otherwise be glued onto it
+        if not os.path.exists(self.events_path):
+            return
+        with open(self.events_path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            f.seek(0)
+            f.truncate(f.read().rfind(b"\n") + 1)
+
+    def save(self) -> None:
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def append_event(self, event: dict) -> int:
+        with self._lock:
+            if self._log is None:
+                self._log = open(self.events_path, "a", encoding="utf-8")
+            self._log.write(json.dumps(event, ensure_ascii=False) + "\n")
+            self._log.flush()
+            self.last_event_id += 1
+            return self.last_event_id
+
+    def iter_events(self, after: int = 0):
+        """Yield (event_id, event) for logged events with an id greater than `after`."""
+        if not os.path.exists(self.events_path):
+            return
+        with open(self.events_path, encoding="utf-8") as f:
+            for event_id, line in enumerate(f, start=1):
+                if event_id > after:
+                    yield event_id, json.loads(line)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+
+class EventLogReader:
+    """Random access by event id to a job's events.jsonl, e.g. for job subscribers.
+
+    Line offsets are indexed incrementally as the log grows (8 bytes per
+    event), so streamed events can be served from disk instead of being
+    kept in memory. Only complete lines are indexed.
+    """
+
+    def __init__(self, job_id: str):
+        self.path = data_path("digikala", "jobs", job_id, "events.jsonl")
+        self._offsets = array("Q")  # start of event id n at index n - 1
+        self._indexed = 0  # bytes of the log indexed so far
+        self._lock = threading.Lock()
+
+    def _index(self, f) -> None:
+        f.seek(self._indexed)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            self._offsets.append(self._indexed)
+            self._indexed += len(line)
+
+    def read(self, first: int, last: int) -> list[dict]:
+        """The events with ids `first` to `last`, inclusive."""
+        with self._lock, open(self.path, "rb") as f:
+            if len(self._offsets) < last:
+                self._index(f)
+            f.seek(self._offsets[first - 1])
+            return [json.loads(f.readline()) for _ in range(last - first + 1)]
@@ -0,0 +1,138 @@
+import csv
+import io
+import json
+import os
+import threading
+
+from apps.common.storage import data_path
+from apps.digikala.records import PRODUCT_URL
+
+FIXED_COLUMNS = ["dkp", "title", "url"]
+VALUE_SEPARATOR = ", "
+
+
+class AttributePivot:
+    """Wide "one column per attribute" table of a job, built as products arrive.
+
+    `pivot_columns.jsonl` is the append-only list of attribute names (a
+    column's index is its line number) and `pivot_rows.jsonl` holds one
+    sparse row per product, `[dkp, title, [[column, value], ...]]`. New
+    columns are flushed before the row that uses them, so any prefix of the
+    rows file can be expanded with the columns file as read after it.
+    """
+
+    def __init__(self, job_id: str):
+        self.columns_path = data_path("digikala", "jobs", job_id, "pivot_columns.jsonl")
+        self.rows_path = data_path("digikala", "jobs", job_id, "pivot_rows.jsonl")
+        self.columns = {}
+        self.rows = 0
+        self._columns_file = None
+        self._rows_file = None
+        self._lock = threading.Lock()
+        # rows first: columns are flushed before the rows that use them, so
+        # the columns read afterwards cover every row counted here
+        self.rows = sum(1 for _ in self._read_lines(self.rows_path))
+        for name in self._read_lines(self.columns_path):
+            self.columns[name] = len(self.columns)
+
+    @staticmethod
+    def _read_lines(path):
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.endswith("\n"):  # skip a row that is still being written
+                    yield json.loads(line)
+
+    def add(self, record) -> None:
+        with self._lock:
+            if self._rows_file is None:
+                self._columns_file = open(self.columns_path, "a", encoding="utf-8")
+                self._rows_file = open(self.rows_path, "a", encoding="utf-8")
+            cells = []
+            for name, values in record.attributes:
+                index = self.columns.get(name)
+                if index is None:
+                    index = self.columns[name] = len(self.columns)
+                    self._columns_file.write(
+                        json.dumps(name, ensure_ascii=False) + "\n"
+                    )
+                    self._columns_file.flush()
+                cells.append([index, VALUE_SEPARATOR.join(values)])
+            row = [record.dkp, record.title, cells]
+            self._rows_file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            self._rows_file.flush()
+            self.rows += 1
+
+    def reset(self) -> None:
+        """Drop everything, e.g. before rebuilding from the checkpoint log."""
+        self.close()
+        with self._lock:
+            for path in (self.columns_path, self.rows_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.columns = {}
+            self.rows = 0
+
+    def close(self) -> None:
+        with self._lock:
+            for f in (self._columns_file, self._rows_file):
+                if f is not None:
+                    f.close()
+            self._columns_file = self._rows_file = None
+
+    def header(self) -> list:
+        return FIXED_COLUMNS + list(self.columns)
+
+    def iter_rows(self):
+        """Dense rows for the products written so far, matching `header()`."""
+        width = len(self.columns)
+        for count, (dkp, title, cells) in enumerate(
+            self._read_lines(self.rows_path), start=1
+        ):
+            if count > self.rows:
+                return
+            values = [""] * width
+            for index, value in cells:
+                values[index] = value
+            yield [dkp, title, PRODUCT_URL.format(dkp=dkp), *values]
+
+
+def stream_csv(pivot: AttributePivot):
+    """CSV text chunks of the pivot (UTF-8 BOM first so Excel reads Persian)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    writer.writerow(pivot.header())
+    yield "\ufeff" + flush()
+    for count, row in enumerate(pivot.iter_rows(), start=1):
+        writer.writerow(row)
+        if count % 500 == 0:
+            yield flush()
+    yield flush()
+
+
+def to_dataframe(pivot: AttributePivot):
+    import pandas as pd
+
+    return pd.DataFrame.from_records(pivot.iter_rows(), columns=pivot.header())
+
+
+def export_bytes(pivot: AttributePivot, fmt: str) -> io.BytesIO:
+    """XLSX / Parquet export through pandas; raises ImportError without it."""
+    df = to_dataframe(pivot)
+    buffer = io.BytesIO()
+    if fmt == "xlsx":
+        df.to_excel(buffer, index=False)
+    elif fmt == "parquet":
+        df.to_parquet(buffer, index=False)
+    else:
+        raise ValueError(f"unsupported format: {fmt}")
+    buffer.seek(0)
+    return buffer
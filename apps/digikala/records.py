@@ -0,0 +1,112 @@
+import hashlib
+import json
+from typing import NamedTuple
+
+PRODUCT_URL = "https://www.digikala.com/product/dkp-{dkp}/"
+
+
+def dkp_from_url(url: str) -> int:
+    return int(url.rstrip("/").split("-")[-1])
+
+
+def category_slug(category_url: str) -> str:
+    """`mobile-phone` from https://www.digikala.com/search/category-mobile-phone/"""
+    return category_url.rstrip("/").split("/")[-1].split("-", 1)[1]
+
+
+class DkpSet:
+    """Set of DKP numbers stored as a growable bitmap (one bit per number).
+
+    Digikala product ids are dense positive integers, so even tens of
+    millions of them fit in a few megabytes, far less than a set of ints or
+    URL strings.
+    """
+
+    __slots__ = ("_bits", "_count")
+
+    def __init__(self, dkps=()):
+        self._bits = bytearray()
+        self._count = 0
+        for dkp in dkps:
+            self.add(dkp)
+
+    def add(self, dkp: int) -> bool:
+        """Add `dkp`; returns False when it was already present."""
+        byte, mask = dkp >> 3, 1 << (dkp & 7)
+        if byte >= len(self._bits):
+            self._bits.extend(
+                bytes(max(byte + 1, 2 * len(self._bits)) - len(self._bits))
+            )
+        if self._bits[byte] & mask:
+            return False
+        self._bits[byte] |= mask
+        self._count += 1
+        return True
+
+    def __contains__(self, dkp: int) -> bool:
+        byte = dkp >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << (dkp & 7)))
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class ProductRecord(NamedTuple):
+    """Compact scraped product: attributes are (name, values) tuples."""
+
+    dkp: int
+    title: str | None
+    attributes: tuple[tuple[str, tuple[str, ...]], ...]
+    cached: bool = False
+
+    @property
+    def url(self) -> str:
+        return PRODUCT_URL.format(dkp=self.dkp)
+
+    def projection(self) -> dict:
+        """Title and attributes as stored in the product cache."""
+        return {
+            "title": self.title,
+            "attributes": [{name: list(values)} for name, values in self.attributes],
+        }
+
+    def content_hash(self) -> int:
+        """64-bit hash of the attributes, to detect changes between scrapes."""
+        payload = json.dumps(self.attributes, ensure_ascii=False).encode()
+        return int.from_bytes(hashlib.blake2b(payload, digest_size=8).digest(), "big")
+
+    def to_dict(self) -> dict:
+        """The PDP_PROGRESS representation used by the UI."""
+        return {**self.projection(), "url": self.url, "cached": self.cached}
+
+    @classmethod
+    def from_dict(cls, dkp: int, data: dict, cached: bool = False) -> "ProductRecord":
+        return cls(
+            dkp, data.get("title"), _project_attributes(data["attributes"]), cached
+        )
+
+
+def _project_attributes(attributes) -> tuple:
+    projected = []
+    for attr in attributes:
+        if "title" in attr:  # raw API attribute
+            name, values = attr.get("title"), attr.get("values")
+        else:  # {name: values} as stored in the cache
+            ((name, values),) = attr.items()
+        projected.append((name, tuple(values or ())))
+    return tuple(projected)
+
+
+def parse_product(raw: bytes, dkp: int) -> ProductRecord:
+    """Project a /v2/product/ response body down to title and attributes.
+
+    The body is decoded by the C JSON decoder and only the record is kept;
+    the decoded payload (reviews, variants, images, ...) is dropped as soon
+    as the record is built.
+    """
+    product = json.loads(raw)["data"]["product"]
+    try:
+        attributes = _project_attributes(product["specifications"][0]["attributes"])
+    except Exception:
+        attributes = ()
+    return ProductRecord(dkp, product.get("title_fa"), attributes)
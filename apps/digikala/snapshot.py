@@ -0,0 +1,34 @@
+import os
+from array import array
+
+from apps.common.storage import data_path
+
+
+class CategorySnapshot:
+    """DKP -> attribute content hash of a category's last delta scrape.
+
+    Stored as two parallel arrays of unsigned 64-bit ints (sorted DKPs, then
+    their hashes), 16 bytes per product, and rewritten atomically.
+    """
+
+    def __init__(self, category: str):
+        self.category = category
+        self.path = data_path("digikala", "snapshots", f"{category}.bin")
+
+    def load(self) -> dict[int, int]:
+        """The stored hashes; empty before the first delta scrape."""
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "rb") as f:
+            values = array("Q", f.read())
+        half = len(values) // 2
+        return dict(zip(values[:half], values[half:]))
+
+    def save(self, hashes: dict[int, int]) -> None:
+        dkps = sorted(hashes)
+        values = array("Q", dkps)
+        values.extend(hashes[dkp] for dkp in dkps)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            values.tofile(f)
+        os.replace(tmp_path, self.path)
@@ -1,155 +1,478 @@
 import json
+import statistics
+import threading
 import traceback
 import time
 import os
 from typing import Generator
 
+from apps.common.jobs import jobs
+from apps.common.scheduler import PeriodicJob
+from apps.common.sse import sse
+from apps.common.storage import data_path
+
+QUARANTINE_SHOWN = 50  # rejected products listed in the QUARANTINE event
+
+SYNC_KEY = (
+    "emami_ghafari_sync"  # single-flight key shared by manual and scheduled syncs
+)
+# minutes between scheduled syncs (counted from the end of the previous one); 0 disables
+SYNC_INTERVAL_MINUTES = float(
+    os.environ.get("EMAMI_GHAFARI_SYNC_INTERVAL_MINUTES", "0")
+)
+RUN_HISTORY = 20  # finished syncs kept in the run history
 
-def generate() -> Generator[str, None, None]:
-    """Server-Sent Events generator.
 
-    Yields JSON messages encoded as SSE `data: ...\n\n` strings.
+def sync_events() -> Generator[dict, None, None]:
+    """Run one crawl + Google Sheets sync, yielding event dicts.
+
     Message types:
-    - STATUS: {'type':'STATUS','msg':...}
+    - STATUS: {'type':'STATUS','msg':...}; page messages also carry the page
+      cache results: 'pages': {not_modified, unchanged, fetched}, 'hit_rate'
     - ERROR: {'type':'ERROR','msg':...,'detail':...}
     - SHEET_URL: {'type':'SHEET_URL','url':...}
-    - CSV_PATH: {'type':'CSV_PATH','path':...}
+    - CSV_PATH: {'type':'CSV_PATH','path':...,'run_id':...,'url':...}
+    - QUARANTINE: {'type':'QUARANTINE','count':...,'products':[{page,id,technical_number,reason}]}
+    - HISTORY: {'type':'HISTORY','run_id':...,'products':...,'previous':...,'changes':{new,delisted,changed,stock_outs}}
     - DONE: {'type':'DONE'}
-    """
 
-    def sse(msg_obj: dict) -> str:
-        """Helper to format SSE data line"""
-        return f"data: {json.dumps(msg_obj, ensure_ascii=False)}\n\n"
+    Every completed crawl is spooled to a gzipped CSV named after the run
+    id; `upload_events` can push it to the sheet again later.
+    """
 
     # initial status
-    yield sse({"type": "STATUS", "msg": "شروع عملیات..."})
+    yield {"type": "STATUS", "msg": "شروع عملیات..."}
 
     # lazy-import crawler so import-time issues are reported to the user
     try:
         from apps.emami_ghafari_quantity_syncer.services import crawler as crawler_mod
+        from apps.emami_ghafari_quantity_syncer.services import spool
+        from apps.emami_ghafari_quantity_syncer.services.table import ProductTable
     except Exception:
         tb = traceback.format_exc()
-        yield sse({"type": "ERROR", "msg": "خطا در ایمپورت سرویس کراولر", "detail": tb})
+        yield {"type": "ERROR", "msg": "خطا در ایمپورت سرویس کراولر", "detail": tb}
         return
+    run_id = spool.new_run_id()
 
     # construct crawler
     try:
-        yield sse({"type": "STATUS", "msg": "در حال ساخت crawler..."})
+        yield {"type": "STATUS", "msg": "در حال ساخت crawler..."}
         crawler = crawler_mod.Main()
     except Exception:
         tb = traceback.format_exc()
-        yield sse({"type": "ERROR", "msg": "خطا در ساخت crawler", "detail": tb})
+        yield {"type": "ERROR", "msg": "خطا در ساخت crawler", "detail": tb}
+        return
+
+    # the upload runs alongside the crawl; if it fails, the full result is
+    # uploaded again after the crawl
+    try:
+        from apps.emami_ghafari_quantity_syncer.services.google_sheets import (
+            service as gs_service_mod,
+            credentials as gs_creds,
+        )
+    except Exception:
+        tb = traceback.format_exc()
+        yield {
+            "type": "ERROR",
+            "msg": "خطا در ایمپورت سرویس Google Sheets",
+            "detail": tb,
+        }
+        yield {"type": "DONE"}
         return
 
+    sheet_errors = []
+    upload = None
+    try:
+        upload = gs_service_mod.GoogleSheetsService().start_upload(
+            crawler_mod.PRODUCT_COLUMNS
+        )
+    except Exception:
+        sheet_errors.append(traceback.format_exc())
+
+    def uploaded():
+        if upload is None:
+            return ""
+        return f" ({upload.uploaded_rows} ردیف در گوگل شیت ثبت شد)"
+
+    def unchanged_pages():
+        results = crawler.page_results
+        total = sum(results.values())
+        return (
+            f"{total - results['fetched']} از {total} صفحه بدون تغییر "
+            f"({crawler.page_hit_rate:.0%})"
+        )
+
     # fetch pages
+    crawled = False
     try:
-        yield sse({"type": "STATUS", "msg": "شروع دریافت محصولات..."})
+        yield {"type": "STATUS", "msg": "شروع دریافت محصولات..."}
         start_ts = time.time()
 
         first_page = crawler._fetch_page_products(page=1)
         total_pages = int(first_page.get("total_pages") or 1)
-        products = list(first_page.get("products") or [])
+        products = first_page.get("products") or []
+        quarantined = list(first_page.get("quarantined") or [])
+        # rows are kept column by column; each page's row dicts are dropped
+        table = ProductTable(crawler_mod.PRODUCT_COLUMNS)
+        table.add_rows(products)
+        if upload is not None:
+            upload.add_rows(products)
+            upload.keep(_quarantined_keys(quarantined))
 
-        yield sse(
-            {
-                "type": "STATUS",
-                "msg": f"صفحه 1 از {total_pages} دریافت شد ({len(products)} محصول)",
-            }
-        )
+        yield {
+            "type": "STATUS",
+            "msg": f"صفحه 1 از {total_pages} دریافت شد ({len(products)} محصول)",
+        }
 
-        total_count = len(products)
-        for page in range(2, total_pages + 1):
-            try:
-                page_resp = crawler._fetch_page_products(page=page)
-                count = len(page_resp.get("products") or [])
-                total_count += count
-                products.extend(page_resp.get("products") or [])
-                yield sse(
-                    {
-                        "type": "STATUS",
-                        "msg": f"صفحه {page} از {total_pages} دریافت شد...",
-                    }
-                )
-                time.sleep(0.2)
-            except Exception:
-                tb = traceback.format_exc()
-                yield sse(
-                    {"type": "ERROR", "msg": f"خطا در دریافت صفحه {page}", "detail": tb}
-                )
-                return
+        # the remaining pages are fetched concurrently but reported in order
+        fetched = 1
+        try:
+            for page, page_resp in crawler._fetch_pages(range(2, total_pages + 1)):
+                page_products = page_resp.get("products") or []
+                page_quarantined = page_resp.get("quarantined") or []
+                table.add_rows(page_products)
+                quarantined.extend(page_quarantined)
+                if upload is not None:
+                    upload.add_rows(page_products)
+                    upload.keep(_quarantined_keys(page_quarantined))
+                fetched = page
+                yield {
+                    "type": "STATUS",
+                    "msg": f"صفحه {page} از {total_pages} دریافت شد...{uploaded()}"
+                    f" - {unchanged_pages()}",
+                    "pages": dict(crawler.page_results),
+                    "hit_rate": crawler.page_hit_rate,
+                }
+        except Exception:
+            tb = traceback.format_exc()
+            yield {
+                "type": "ERROR",
+                "msg": f"خطا در دریافت صفحه {fetched + 1}",
+                "detail": tb,
+            }
+            return
 
         elapsed = round(time.time() - start_ts, 2)
 
         # build DataFrame
         try:
-            import pandas as pd
-
-            df = pd.DataFrame(products)
+            df = table.to_frame()
             rows = len(df)
         except Exception:
             df = None
             rows = 0
 
-        yield sse(
-            {"type": "STATUS", "msg": f"دریافت شد: {rows} ردیف در {elapsed} ثانیه"}
-        )
+        yield {
+            "type": "STATUS",
+            "msg": f"دریافت شد: {rows} ردیف در {elapsed} ثانیه، {unchanged_pages()}",
+            "pages": dict(crawler.page_results),
+            "hit_rate": crawler.page_hit_rate,
+        }
+        crawled = True
+
+        # malformed products are skipped; their sheet rows stay as they are
+        if quarantined:
+            yield {
+                "type": "QUARANTINE",
+                "count": len(quarantined),
+                "products": quarantined[:QUARANTINE_SHOWN],
+            }
+            spool.write_quarantine(run_id, quarantined)
+
+        # keep the result on disk, so a failed upload never needs a re-crawl
+        if df is not None:
+            path = spool.write_spool(run_id, df)
+            yield {
+                "type": "CSV_PATH",
+                "path": path,
+                "run_id": run_id,
+                "url": f"/emami-ghafari-sync/spool/{run_id}.csv.gz",
+            }
+            yield from _history_events(run_id, df, _quarantined_keys(quarantined))
 
     except Exception:
         tb = traceback.format_exc()
-        yield sse({"type": "ERROR", "msg": "خطا در دریافت محصولات", "detail": tb})
+        yield {"type": "ERROR", "msg": "خطا در دریافت محصولات", "detail": tb}
         return
+    finally:
+        # a failed crawl must not trim the sheet down to the pages it got
+        if upload is not None and not crawled:
+            upload.abort()
+
+    sheet_url = getattr(gs_creds, "GOOGLE_SHEETS_TARGET_SHEET_URL", None)
+    if upload is not None:
+        try:
+            yield {"type": "STATUS", "msg": "درحال تکمیل بروزرسانی گوگل شیت..."}
+            stats = upload.finish()
+            yield {"type": "STATUS", "msg": _sheet_stats_message(stats)}
+            yield {"type": "SHEET_URL", "url": sheet_url}
+            yield {"type": "DONE"}
+            return
+        except Exception:
+            sheet_errors.append(traceback.format_exc())
+            gs_service_mod.forget_worksheets()
+
+    # upload the whole result again (3 tries)
+    yield from _upload_with_retries(
+        gs_service_mod,
+        df,
+        sheet_url,
+        sheet_errors,
+        run_id,
+        _quarantined_keys(quarantined),
+    )
+
 
-    # attempt to upload to Google Sheets (3 tries), fallback to CSV
+def _history_events(run_id, df, quarantined_keys):
+    """Add the result to the price/quantity history; a failure only warns."""
     try:
-        from apps.emami_ghafari_quantity_syncer.services.google_sheets import (
-            service as gs_service_mod,
-            credentials as gs_creds,
-        )
+        from apps.emami_ghafari_quantity_syncer.services import history
+
+        meta = history.write_snapshot(run_id, df, quarantined_keys)
     except Exception:
-        tb = traceback.format_exc()
-        yield sse(
-            {"type": "ERROR", "msg": "خطا در ایمپورت سرویس Google Sheets", "detail": tb}
-        )
-        yield sse({"type": "DONE"})
+        yield {
+            "type": "STATUS",
+            "msg": "⚠️ ذخیره تاریخچه قیمت/موجودی ناموفق بود",
+            "detail": traceback.format_exc(),
+        }
         return
+    yield {"type": "HISTORY", **meta}
+
 
+def _quarantined_keys(quarantined):
+    return [
+        item["technical_number"] for item in quarantined if item.get("technical_number")
+    ]
+
+
+def _upload_with_retries(
+    gs_service_mod, df, sheet_url, sheet_errors, run_id=None, keep_keys=()
+):
     MAX_RETRIES = 3
     WAIT_SECONDS = 5
-    sheet_errors = []
 
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            yield sse(
-                {
-                    "type": "STATUS",
-                    "msg": "درحال بروزرسانی گوگل شیت...",
-                }
-            )
+            yield {
+                "type": "STATUS",
+                "msg": "درحال بروزرسانی گوگل شیت...",
+            }
 
             gs = gs_service_mod.GoogleSheetsService()
             # if df is None or empty, pass an empty DataFrame
             import pandas as pd
 
             upload_df = pd.DataFrame() if df is None else df
-            gs.update_sheet(upload_df)
+            stats = gs.update_sheet(upload_df, keep_keys)
+            if stats:
+                yield {"type": "STATUS", "msg": _sheet_stats_message(stats)}
 
-            sheet_url = getattr(gs_creds, "GOOGLE_SHEETS_TARGET_SHEET_URL", None)
-            yield sse({"type": "SHEET_URL", "url": sheet_url})
-            yield sse({"type": "DONE"})
+            yield {"type": "SHEET_URL", "url": sheet_url}
+            yield {"type": "DONE"}
             return
 
         except Exception:
             tb = traceback.format_exc()
             sheet_errors.append(tb)
+            # the next attempt reopens the worksheet but keeps the client
+            gs_service_mod.forget_worksheets()
             if attempt < MAX_RETRIES:
-                yield sse(
-                    {
-                        "type": "STATUS",
-                        "msg": f"خطا در تلاش {attempt}. {WAIT_SECONDS} ثانیه تا تلاش بعدی...",
-                    }
-                )
+                yield {
+                    "type": "STATUS",
+                    "msg": f"خطا در تلاش {attempt}. {WAIT_SECONDS} ثانیه تا تلاش بعدی...",
+                }
                 time.sleep(WAIT_SECONDS)
 
+    # every attempt failed; end the stream explicitly so clients stop waiting.
+    # `run_id` names the spooled result the upload can be retried from
+    yield {
+        "type": "ERROR",
+        "msg": f"بروزرسانی گوگل شیت پس از {MAX_RETRIES} تلاش ناموفق بود",
+        "detail": sheet_errors[-1],
+        "run_id": run_id,
+    }
+
+
+def upload_events(run_id: str) -> Generator[dict, None, None]:
+    """Upload a spooled crawl result to Google Sheets without crawling again."""
+    from apps.emami_ghafari_quantity_syncer.services import spool
+    from apps.emami_ghafari_quantity_syncer.services.google_sheets import (
+        service as gs_service_mod,
+        credentials as gs_creds,
+    )
+
+    yield {"type": "STATUS", "msg": f"بارگذاری نتیجه ذخیره‌شده {run_id}..."}
+    df = spool.read_spool(run_id)
+    if df is None:
+        yield {"type": "ERROR", "msg": f"نتیجه ذخیره‌شده {run_id} پیدا نشد"}
+        return
+    yield {"type": "STATUS", "msg": f"{len(df)} ردیف از فایل ذخیره‌شده بارگذاری شد"}
+    sheet_url = getattr(gs_creds, "GOOGLE_SHEETS_TARGET_SHEET_URL", None)
+    keep_keys = _quarantined_keys(spool.read_quarantine(run_id))
+    yield from _upload_with_retries(
+        gs_service_mod, df, sheet_url, [], run_id, keep_keys
+    )
+
+
+def _sheet_stats_message(stats):
+    if "rewritten" in stats:
+        return f"گوگل شیت بازنویسی شد ({stats['rewritten']} ردیف)"
+    return (
+        f"گوگل شیت بروزرسانی شد: {stats['changed_cells']} سلول تغییر کرد، "
+        f"{stats['added']} ردیف جدید، {stats['removed']} ردیف حذف شد"
+    )
+
+
+def generate() -> Generator[str, None, None]:
+    """Server-Sent Events generator running a sync inline.
+
+    Yields the `sync_events` messages encoded as SSE `data: ...\n\n` strings.
+    """
+    for event in sync_events():
+        yield sse(event)
+
+
+_history_lock = threading.Lock()
+
+
+def _history_path() -> str:
+    return data_path("emami_ghafari", "runs.json")
+
+
+def _read_history() -> list[dict]:
+    if not os.path.exists(_history_path()):
+        return []
+    with open(_history_path(), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_history() -> list[dict]:
+    """Finished syncs, newest first."""
+    with _history_lock:
+        return _read_history()
+
+
+def _record_run(run: dict) -> None:
+    with _history_lock:
+        history = [run] + _read_history()
+        tmp_path = _history_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(history[:RUN_HISTORY], f)
+        os.replace(tmp_path, _history_path())
+
+
+def _recorded_sync(trigger: str) -> Generator[dict, None, None]:
+    """`sync_events`, with the outcome and duration added to the run history."""
+    run = {"trigger": trigger, "status": "done", "run_id": None}
+    run["started_at"] = time.time()
+    try:
+        for event in sync_events():
+            if event["type"] == "ERROR":
+                run["status"] = "failed"
+            elif event["type"] == "CSV_PATH":
+                run["run_id"] = event["run_id"]
+            yield event
+    except Exception:
+        run["status"] = "failed"
+        raise
+    finally:
+        run["finished_at"] = time.time()
+        run["duration"] = round(run["finished_at"] - run["started_at"], 2)
+        _record_run(run)
+
+
+class SheetBusy(Exception):
+    """Another job is already writing the worksheet."""
+
+
+def submit_job(trigger: str = "manual"):
+    """Run a sync as a background job (see apps.common.jobs).
+
+    Single-flight: while a sync is queued or running, every trigger (the
+    page, the schedule) gets that job instead of starting another one.
+    Syncs and spooled uploads share SYNC_KEY, so only one job writes the
+    worksheet at a time; raises SheetBusy while an upload is running.
+    """
+    job = jobs.submit(
+        "emami_ghafari_sync",
+        lambda: _recorded_sync(trigger),
+        params={"trigger": trigger},
+        key=SYNC_KEY,
+    )
+    if job.kind != "emami_ghafari_sync":
+        raise SheetBusy(
+            "آپلود یک نتیجه ذخیره‌شده در جریان است، کمی بعد دوباره تلاش کنید."
+        )
+    return job
+
+
+schedule = PeriodicJob(
+    "emami_ghafari_sync", SYNC_INTERVAL_MINUTES * 60, lambda: submit_job("schedule")
+)
+
+
+def start_scheduler() -> None:
+    """Start the scheduled sync, if an interval is configured.
+
+    The first run is due one interval after the last recorded sync, so a
+    restart neither skips nor repeats a run. Every process running the app
+    has its own schedule.
+    """
+    if not schedule.enabled:
+        return
+    history = run_history()
+    first_delay = None
+    if history:
+        first_delay = history[0]["finished_at"] + schedule.interval - time.time()
+    schedule.start(first_delay)
+
+
+def sync_status() -> dict:
+    """The running sync, the last finished one and the next scheduled one."""
+    history = run_history()
+    now = time.time()
+    running = None
+    job = jobs.active(SYNC_KEY)
+    if job is not None:
+        running = job.to_dict()
+        running["elapsed"] = round(now - job.started_at, 2) if job.started_at else 0
+    next_run = None
+    if schedule.next_run_at is not None:
+        # recent successful syncs estimate how long the next one will take
+        durations = [run["duration"] for run in history if run["status"] == "done"]
+        next_run = {
+            "at": schedule.next_run_at,
+            "in_seconds": round(max(0.0, schedule.next_run_at - now), 2),
+            "expected_duration": (
+                statistics.median(durations[:5]) if durations else None
+            ),
+        }
+    return {
+        "schedule": schedule.to_dict(),
+        "running": running,
+        "last_run": history[0] if history else None,
+        "next_run": next_run,
+        "history": history,
+    }
+
+
+def submit_upload_job(run_id: str):
+    """Retry the Google Sheets upload of a spooled crawl result as a background job.
+
+    Shares SYNC_KEY with syncs (see `submit_job`): retrying the same run
+    joins its upload, and SheetBusy is raised while a sync or the upload of
+    another run is in progress.
+    """
+    job = jobs.submit(
+        "emami_ghafari_upload",
+        lambda: upload_events(run_id),
+        params={"run_id": run_id},
+        key=SYNC_KEY,
+    )
+    if job.kind != "emami_ghafari_upload" or job.params.get("run_id") != run_id:
+        raise SheetBusy("همگام‌سازی دیگری در جریان است، کمی بعد دوباره تلاش کنید.")
+    return job
+
 
 main_html = """
 <!doctype html>
@@ -169,6 +492,7 @@ main_html = """
     button:disabled { background: #999; }
     .progress-container { margin-bottom: 20px; }
     progress { width: 100%; height: 25px; border-radius: 5px; }
+    #schedule-status { text-align: center; color: #555; font-size: 14px; }
     #log { max-height: 400px; overflow-y: auto; margin-top: 15px; }
     .error { white-space: pre-wrap; font-family: 'Vazirmatn'; }
     .container { max-width: 1000px; margin: auto; padding: 20px; background: white; border-radius: 10px; box-shadow: 0 0 15px rgba(0,0,0,0.1); }
@@ -191,6 +515,7 @@ main_html = """
     </div>
 
     <button onclick="startSync()" id="start-btn">شروع همگام‌سازی</button>
+    <div id="schedule-status"></div>
 
     <div id="log"></div>
     <div id="final-output"></div>
@@ -200,7 +525,36 @@ main_html = """
     let evtSource = null;
     let totalPages = 1;
 
-    function startSync() {
+    function formatTime(ts) {
+      return new Date(ts * 1000).toLocaleString('fa-IR');
+    }
+
+    function loadStatus() {
+      fetch('/emami-ghafari-sync/status')
+        .then(r => r.json())
+        .then(status => {
+          const parts = [];
+          if(status.running) {
+            parts.push(`همگام‌سازی در حال اجرا (${Math.round(status.running.elapsed)} ثانیه)`);
+          }
+          if(status.last_run) {
+            const last = status.last_run;
+            parts.push(`آخرین اجرا: ${formatTime(last.started_at)}، ${Math.round(last.duration)} ثانیه، ${last.status === 'done' ? 'موفق' : 'ناموفق'}`);
+          }
+          if(status.next_run) {
+            const expected = status.next_run.expected_duration;
+            parts.push(`اجرای بعدی: ${formatTime(status.next_run.at)}${expected ? `، حدود ${Math.round(expected)} ثانیه` : ''}`);
+          } else if(!status.schedule.enabled) {
+            parts.push('اجرای زمان‌بندی‌شده غیرفعال است');
+          }
+          document.getElementById('schedule-status').innerText = parts.join(' | ');
+        })
+        .catch(() => {});
+    }
+    loadStatus();
+
+    // with a run id, only the Google Sheets upload of that spooled result is retried
+    function startSync(runId) {
       if(evtSource) { evtSource.close(); }
       
       const btn = document.getElementById('start-btn');
@@ -217,7 +571,30 @@ main_html = """
       progressText.innerText = '';
       progressTitle.innerText = 'آماده به کار';
 
-      evtSource = new EventSource('/emami-ghafari-sync-run');
+      // the sync runs as a background job; this page only subscribes to its events
+      const jobUrl = runId
+        ? `/emami-ghafari-sync/spool/${encodeURIComponent(runId)}/upload`
+        : '/emami-ghafari-sync/jobs';
+      fetch(jobUrl, { method: 'POST' })
+        .then(r => r.json().then(data => [r.ok, data]))
+        .then(([ok, data]) => {
+          if(!ok) { showError(data.error); return; }
+          subscribe(data.job_id);
+        })
+        .catch(() => showError('ارتباط با سرور برقرار نشد'));
+
+      function showError(text) {
+        progressTitle.innerText = 'خطا رخ داد';
+        btn.disabled = false;
+        const errorBox = document.createElement('div');
+        errorBox.className = 'message-box error';
+        errorBox.innerHTML = `<strong>خطا:</strong> ${text}`;
+        log.innerHTML = '';
+        log.appendChild(errorBox);
+      }
+
+      function subscribe(jobId) {
+      evtSource = new EventSource(`/jobs/${encodeURIComponent(jobId)}/events`);
       
       evtSource.onmessage = function(e) {
         const msg = JSON.parse(e.data);
@@ -247,8 +624,16 @@ main_html = """
           errorBox.innerHTML = `<strong>خطا: </strong>${msg.msg}${msg.detail ? '<br><br>' + msg.detail.replace(/\\n/g, '<br>') : ''}`;
           log.innerHTML = ''; // پاک کردن لاگ‌های قبلی
           log.appendChild(errorBox);
+          if(msg.run_id) {
+            // the crawl result is spooled; retry the upload without crawling again
+            const retryBtn = document.createElement('button');
+            retryBtn.innerText = 'تلاش مجدد آپلود از فایل ذخیره‌شده';
+            retryBtn.onclick = () => startSync(msg.run_id);
+            log.appendChild(retryBtn);
+          }
           
           if(evtSource) { evtSource.close(); }
+          loadStatus();
         }
         else if(msg.type === 'SHEET_URL') {
           const successBox = document.createElement('div');
@@ -257,28 +642,48 @@ main_html = """
           log.innerHTML = '';
           log.appendChild(successBox);
         }
+        else if(msg.type === 'QUARANTINE') {
+          const box = document.createElement('div');
+          box.className = 'message-box error';
+          const items = msg.products
+            .map(p => `<li>صفحه ${p.page}: ${p.technical_number || p.id || '-'} (${p.reason})</li>`)
+            .join('');
+          box.innerHTML = `<strong>${msg.count} محصول نامعتبر کنار گذاشته شد (ردیف آن‌ها در شیت تغییر نمی‌کند):</strong><ul>${items}</ul>`;
+          finalOutput.appendChild(box);
+        }
+        else if(msg.type === 'HISTORY') {
+          const box = document.createElement('div');
+          box.className = 'message-box success';
+          const c = msg.changes;
+          box.innerHTML = c
+            ? `<strong>تغییرات نسبت به اجرای قبل:</strong> ${c.changed} محصول تغییر کرد، ${c.new} جدید، ${c.delisted} حذف‌شده، ${c.stock_outs} ناموجود شد <a href="/emami-ghafari-sync/history/changes?since=${msg.previous}&until=${msg.run_id}" target="_blank">جزئیات</a>`
+            : `<strong>اولین نسخه تاریخچه ذخیره شد</strong> (${msg.products} محصول)`;
+          finalOutput.appendChild(box);
+        }
         else if(msg.type === 'CSV_PATH') {
           const successBox = document.createElement('div');
           successBox.className = 'message-box success';
-          successBox.innerHTML = `<strong>فایل CSV ذخیره شد:</strong> <code>${msg.path}</code>`;
+          successBox.innerHTML = `<strong>فایل CSV ذخیره شد:</strong> <a href="${msg.url}">دانلود</a> <code>${msg.path}</code>`;
+          finalOutput.appendChild(successBox);
         }
         else if(msg.type === 'DONE') {
           progressTitle.innerText = 'عملیات به پایان رسید';
           btn.disabled = false;
           if(evtSource) { evtSource.close(); }
+          loadStatus();
         }
       };
       
       evtSource.onerror = function() {
-        progressTitle.innerText = 'خطا در ارتباط';
-        btn.disabled = false;
-        const errorBox = document.createElement('div');
-        errorBox.className = 'message-box error';
-        errorBox.innerHTML = '<strong>خطا:</strong> ارتباط با سرور قطع شد';
-        log.innerHTML = '';
-        log.appendChild(errorBox);
-        if(evtSource) { evtSource.close(); }
+        // EventSource reconnects with Last-Event-ID on its own; the job keeps
+        // running on the server, so only a CLOSED stream is a real failure
+        if(evtSource.readyState === EventSource.CLOSED) {
+          showError('ارتباط با سرور قطع شد');
+        } else {
+          progressTitle.innerText = 'ارتباط قطع شد، در حال اتصال مجدد...';
+        }
       };
+      }
     }
   </script>
 </body>
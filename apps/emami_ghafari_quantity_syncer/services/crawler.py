@@ -1,13 +1,133 @@
+import os
 import requests
-from typing import Any
+import threading
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from apps.common.rate_limit import TokenBucket
+from apps.emami_ghafari_quantity_syncer.services.page_cache import (
+    PageCache,
+    content_hash,
+)
+
+STORE_URL = os.environ.get("EMAMI_GHAFARI_STORE_URL", "https://mvm5052.com")
+PRODUCTS_PATH = "/wp-json/wc/store/v1/products?per_page=100&page={page}"
+REQUESTS_PER_SECOND = 5.0  # per host, shared by every crawler in the process
+PAGE_WORKERS = 4  # listing pages fetched concurrently
+
+
+class PageFetchError(Exception):
+    pass
+
+
+class InvalidField(ValueError):
+    pass
+
+
+def _text(value):
+    if isinstance(value, (dict, list)):
+        raise InvalidField(f"expected text, got {type(value).__name__}")
+    return value
+
+
+def _quantity(value):
+    if isinstance(value, bool) or not str(value).strip().lstrip("-").isdigit():
+        raise InvalidField(f"invalid quantity {value!r}")
+    return int(value)
+
+
+def _amount(value):
+    # the Store API sends prices as strings of minor units
+    if isinstance(value, bool) or not str(value).strip().isdigit():
+        raise InvalidField(f"invalid amount {value!r}")
+    return value
+
+
+def _categories(value):
+    if not isinstance(value, list):
+        raise InvalidField(f"expected a list, got {type(value).__name__}")
+    return "-".join(
+        str(category["name"])
+        for category in value
+        if isinstance(category, dict) and category.get("name")
+    )
+
+
+# column, path in the Store API product, parser, required
+PRODUCT_FIELDS = (
+    ("name", ("name",), _text, False),
+    ("technical_number", ("sku",), _text, True),
+    ("quantity", ("add_to_cart", "maximum"), _quantity, True),
+    ("categories", ("categories",), _categories, False),
+    ("in_stock", ("stock_availability", "text"), _text, False),
+    ("price", ("prices", "price"), _amount, True),
+    ("regular_price", ("prices", "regular_price"), _amount, False),
+    ("sale_price", ("prices", "sale_price"), _amount, False),
+    ("currency_symbol", ("prices", "currency_symbol"), _text, False),
+    ("url", ("permalink",), _text, False),
+)
+PRODUCT_COLUMNS = tuple(field[0] for field in PRODUCT_FIELDS)
+# column storage of a crawl result (see services.table); the rest stays text
+INTEGER_COLUMNS = ("quantity", "price", "regular_price", "sale_price")
+CATEGORICAL_COLUMNS = ("categories", "in_stock", "currency_symbol")
+
+
+def _text_or_none(value):
+    return None if isinstance(value, (dict, list)) or value in (None, "") else value
+
+
+def _dig(product, path):
+    value = product
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def parse_product(product) -> tuple[dict | None, str | None]:
+    """Normalize one Store API product into a row; returns (row, None) or (None, reason).
+
+    Optional fields that are missing or malformed become None; a missing
+    or malformed required field rejects the product.
+    """
+    if not isinstance(product, dict):
+        return None, f"expected an object, got {type(product).__name__}"
+    row = {}
+    for column, path, parse, required in PRODUCT_FIELDS:
+        value = _dig(product, path)
+        if value is None or value == "":
+            if required:
+                return None, f"missing {'.'.join(path)}"
+            row[column] = None
+            continue
+        try:
+            row[column] = parse(value)
+        except InvalidField as e:
+            if required:
+                return None, f"{'.'.join(path)}: {e}"
+            row[column] = None
+    return row, None
+
+
+_host_limiters = {}
+_host_limiters_lock = threading.Lock()
+
+
+def host_limiter(url: str) -> TokenBucket:
+    """The request-rate bucket shared by all requests to `url`'s host."""
+    host = urlsplit(url).netloc
+    with _host_limiters_lock:
+        if host not in _host_limiters:
+            _host_limiters[host] = TokenBucket(REQUESTS_PER_SECOND)
+        return _host_limiters[host]
 
 
 class Main:
-    def __init__(self):
-        self.url = (
-            "https://mvm5052.com/wp-json/wc/store/v1/products?per_page=100&page={page}"
-        )
+    def __init__(self, use_cache: bool = True):
+        self.url = STORE_URL + PRODUCTS_PATH
         self.headers = {
             "user-agent": (
                 "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
@@ -15,45 +135,136 @@ class Main:
             )
         }
         self.max_retries = 3
+        self.limiter = host_limiter(self.url)
+        # pages whose content did not change since the last crawl are not parsed again
+        self.page_cache = PageCache() if use_cache else None
+        self.page_results = Counter()  # "not_modified" / "unchanged" / "fetched"
+        self._page_results_lock = threading.Lock()
+
+    @property
+    def page_hit_rate(self) -> float:
+        """Share of the pages fetched so far that were served from the page cache."""
+        total = sum(self.page_results.values())
+        return (total - self.page_results["fetched"]) / total if total else 0.0
 
-    def _clean_products(self, products: dict[str, Any]) -> dict[str:str]:
-        return [
-            {
-                "name": product.get("name"),
-                "technical_number": product.get("sku"),
-                "quantity": product.get("add_to_cart").get("maximum"),
-                "categories": "-".join([cat.get("name") for cat in product.get("categories")]),
-                "in_stock": product.get("stock_availability").get("text"),
-                "price": product.get("prices").get("price"),
-                "regular_price": product.get("prices").get("regular_price"),
-                "sale_price": product.get("prices").get("sale_price"),
-                "currency_symbol": product.get("prices").get("currency_symbol"),
-                "url": product.get("permalink"),
-
-            }
-            for product in products
-        ]
+    def _count(self, result: str) -> None:
+        with self._page_results_lock:
+            self.page_results[result] += 1
+
+    def _clean_products(self, products) -> tuple[list[dict], list[dict]]:
+        """Rows of the valid products, and the rejected ones with their reasons."""
+        if not isinstance(products, list):
+            return [], [{"reason": "response is not a list of products"}]
+        rows, quarantined = [], []
+        for product in products:
+            row, reason = parse_product(product)
+            if row is not None:
+                rows.append(row)
+                continue
+            product = product if isinstance(product, dict) else {}
+            quarantined.append(
+                {
+                    "id": product.get("id"),
+                    "technical_number": _text_or_none(product.get("sku")),
+                    "reason": reason,
+                }
+            )
+        return rows, quarantined
 
     def _fetch_page_products(self, page):
+        """One listing page as {total_products, total_pages, products, quarantined, cache}.
+
+        Later pages are requested conditionally with the validators of the
+        last crawl; a 304, or a body with the same content hash, reuses the
+        rows parsed back then. Page 1 is always fetched unconditionally, as
+        its headers carry the page count.
+        """
+        url = self.url.format(page=page)
+        cached = self.page_cache.get(page, url) if self.page_cache else None
+        headers = dict(self.headers)
+        if page > 1:
+            headers.update(PageCache.conditional_headers(cached))
+
+        # only the request is retried; malformed products are quarantined
         exceptions = []
         for attempt in range(1, self.max_retries + 1):
             try:
-                response = requests.get(
-                    self.url.format(page=page),
-                    headers=self.headers,
-                )
+                self.limiter.acquire()
+                response = requests.get(url, headers=headers)
 
+                if response.status_code == 304 and cached is not None:
+                    self._count("not_modified")
+                    return self._cached_result(cached, "not_modified")
                 if response.status_code != 200:
-                    raise BaseException(
-                        f"Error on fetching page: {page} | status code: {response.status_code} on {attempt}/{self.total_attempts} attempt."
+                    raise PageFetchError(
+                        f"Error on fetching page: {page} | status code: {response.status_code} on {attempt}/{self.max_retries} attempt."
                     )
-
-                return {
-                    "total_products": response.headers.get("X-WP-Total"),
-                    "total_pages": response.headers.get("X-WP-TotalPages"),
-                    "products": self._clean_products(products=response.json()),
-                }
-            except Exception as e:
+                body_hash = content_hash(response.content)
+                if cached is not None and cached["hash"] == body_hash:
+                    break
+                products = response.json()
+                break
+            except (requests.RequestException, ValueError, PageFetchError) as e:
                 exceptions.append(e)
                 time.sleep(0.1)
-        raise BaseException(exceptions)
+        else:
+            raise PageFetchError(exceptions)
+
+        totals = {
+            "total_products": response.headers.get("X-WP-Total"),
+            "total_pages": response.headers.get("X-WP-TotalPages"),
+        }
+        if cached is not None and cached["hash"] == body_hash:
+            self._count("unchanged")
+            return {**self._cached_result(cached, "unchanged"), **totals}
+
+        rows, quarantined = self._clean_products(products)
+        for item in quarantined:
+            item["page"] = page
+        self._count("fetched")
+        if self.page_cache is not None:
+            self.page_cache.put(
+                page,
+                {
+                    "url": url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "hash": body_hash,
+                    **totals,
+                    "products": rows,
+                    "quarantined": quarantined,
+                },
+            )
+        return {
+            **totals,
+            "products": rows,
+            "quarantined": quarantined,
+            "cache": "fetched",
+        }
+
+    @staticmethod
+    def _cached_result(cached, result):
+        return {
+            "total_products": cached.get("total_products"),
+            "total_pages": cached.get("total_pages"),
+            "products": cached["products"],
+            "quarantined": cached["quarantined"],
+            "cache": result,
+        }
+
+    def _fetch_pages(self, pages):
+        """Fetch `pages` concurrently, yielding (page, result) in page order.
+
+        At most PAGE_WORKERS requests are in flight and the host's bucket caps
+        the request rate; the first failing page raises and the pages not
+        started yet are cancelled.
+        """
+        executor = ThreadPoolExecutor(max_workers=PAGE_WORKERS)
+        futures = {
+            page: executor.submit(self._fetch_page_products, page) for page in pages
+        }
+        try:
+            for page, future in futures.items():
+                yield page, future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -1,28 +1,354 @@
+import queue
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+
 import gspread
+from gspread.utils import ValueInputOption, ValueRenderOption, rowcol_to_a1
+from google.auth.transport.requests import Request
 from google.oauth2.service_account import Credentials
 import pandas as pd
-import gspread_dataframe
+from apps.common.rate_limit import TokenBucket
 from apps.emami_ghafari_quantity_syncer.services.google_sheets import credentials
 
+KEY_COLUMN = "technical_number"
+RANGES_PER_REQUEST = 2000  # value ranges per values.batchUpdate call
+UPLOAD_CHUNK_ROWS = 500  # rows per chunk of a pipelined upload
+UPLOAD_QUEUE_CHUNKS = 4  # chunks buffered ahead of the uploader thread
+# Sheets allows 60 read and 60 write requests per minute per user
+SHEETS_REQUESTS_PER_SECOND = 1.0
+SHEETS_BURST = 10
+
+# cell texts written as numbers: integers that read back as the same digits
+# (no leading zeros, within the 15 significant digits Sheets keeps)
+_INTEGER_TEXT_RE = re.compile(r"^(0|-?[1-9][0-9]{0,14})$")
+
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)  # refresh the access token this early
+
+sheets_limiter = TokenBucket(SHEETS_REQUESTS_PER_SECOND, capacity=SHEETS_BURST)
+
+# one authorized client per process, shared by every sync and retry
+_client_lock = threading.Lock()
+_credentials = None
+_client = None
+_worksheets = {}  # (sheet id, worksheet name) -> worksheet handle
+
+
+def get_client() -> gspread.Client:
+    """The process-wide client, with its access token refreshed before it expires."""
+    global _credentials, _client
+    with _client_lock:
+        if _client is None:
+            _credentials = Credentials.from_service_account_info(
+                credentials.GOOGLE_SHEETS_CREDENTIALS,
+                scopes=credentials.GOOGLE_SHEETS_SCOPES,
+            )
+            _client = gspread.authorize(_credentials)
+        # google-auth keeps `expiry` as naive UTC
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        expiry = _credentials.expiry
+        if not _credentials.token or not expiry or expiry - now < TOKEN_REFRESH_MARGIN:
+            _credentials.refresh(Request())
+        return _client
+
+
+def get_worksheet(sheet_id: str, sheet_name: str) -> gspread.Worksheet:
+    """Cached worksheet handle, so repeated syncs skip open_by_key/worksheet."""
+    client = get_client()
+    with _client_lock:
+        key = (sheet_id, sheet_name)
+        if key not in _worksheets:
+            _worksheets[key] = client.open_by_key(sheet_id).worksheet(sheet_name)
+        return _worksheets[key]
+
+
+def forget_worksheets() -> None:
+    """Drop cached worksheet handles (e.g. after a failed upload); the client stays."""
+    with _client_lock:
+        _worksheets.clear()
+
+
+def _as_cells(df: pd.DataFrame) -> pd.DataFrame:
+    """Cell texts as the sheet returns them: strings, empty for missing values."""
+    return df.astype(object).where(df.notna(), "").astype(str)
+
+
+def _as_values(rows) -> list[list]:
+    """Rows of cell texts as sent with ValueInputOption.raw.
+
+    Sheets does not parse RAW input, so a technical number like "0123" or a
+    name like "1/2" is stored as that text; integer texts are sent as
+    numbers. Either way the cell reads back unformatted as the same text.
+    """
+    return [
+        [int(cell) if _INTEGER_TEXT_RE.match(cell) else cell for cell in row]
+        for row in rows
+    ]
+
+
+def _with_occurrence(df: pd.DataFrame) -> pd.DataFrame:
+    # repeated (or empty) technical numbers are matched in order of appearance
+    return df.assign(_occurrence=df.groupby(KEY_COLUMN).cumcount())
+
+
+def _runs(numbers):
+    """Sorted numbers as (first, last) runs of consecutive values."""
+    runs = []
+    for number in sorted(numbers):
+        if runs and runs[-1][1] == number - 1:
+            runs[-1][1] = number
+        else:
+            runs.append([number, number])
+    return runs
+
+
+class SheetWriter:
+    """Keyed, incremental update of the worksheet from chunks of product rows.
+
+    The sheet is read once, on the first chunk, and each chunk is diffed
+    against it on `technical_number` (repeated numbers are matched in order
+    of appearance across chunks): changed cells are rewritten right away as
+    one span per row. New products are held until `finish`, where they take
+    the rows of products that never showed up or are appended, and the
+    leftover rows are deleted. An empty sheet or a different header is
+    cleared and rewritten chunk by chunk instead. Cells are written RAW
+    (see `_as_values`), so they read back as the texts they are diffed as.
+    Every API call waits for `sheets_limiter`.
+    """
+
+    def __init__(self, worksheet, header):
+        self.worksheet = worksheet
+        self.header = list(header)
+        self.stats = {"changed_cells": 0, "added": 0, "removed": 0}
+        self._old = None
+        self._loaded = False
+        self._occurrences = {}  # key -> rows seen so far
+        self._matched_rows = []
+        self._kept_keys = set()
+        self._added = []
+        self._rewritten = 0
+
+    def _call(self, method, *args, **kwargs):
+        sheets_limiter.acquire()
+        return method(*args, **kwargs)
+
+    def _load(self) -> None:
+        self._loaded = True
+        values = self._call(
+            self.worksheet.get_all_values,
+            value_render_option=ValueRenderOption.unformatted,
+        )
+        if values and values[0] == self.header and KEY_COLUMN in self.header:
+            width = len(self.header)
+            old = pd.DataFrame(
+                [(row + [""] * width)[:width] for row in values[1:]],
+                columns=self.header,
+            )
+            old = _with_occurrence(_as_cells(old))
+            old["_row"] = range(2, len(old) + 2)
+            self._old = old.set_index([KEY_COLUMN, "_occurrence"])
+        else:
+            self._call(self.worksheet.clear)
+            self._call(
+                self.worksheet.append_rows,
+                [self.header],
+                value_input_option=ValueInputOption.raw,
+            )
+
+    def keep(self, keys) -> None:
+        """Leave the rows of these technical numbers as they are, even if absent."""
+        self._kept_keys.update(str(key) for key in keys)
+
+    def add(self, df: pd.DataFrame) -> None:
+        if not self._loaded:
+            self._load()
+        if df.empty:
+            return
+        cells = _as_cells(df[self.header])
+        if self._old is None:
+            self._call(
+                self.worksheet.append_rows,
+                _as_values(cells.values.tolist()),
+                value_input_option=ValueInputOption.raw,
+            )
+            self._rewritten += len(cells)
+            return
+
+        keys = cells[KEY_COLUMN]
+        offsets = keys.map(self._occurrences).fillna(0).astype(int)
+        cells["_occurrence"] = cells.groupby(KEY_COLUMN).cumcount() + offsets
+        for key, count in keys.value_counts().items():
+            self._occurrences[key] = self._occurrences.get(key, 0) + count
+        merged = cells.join(self._old, on=[KEY_COLUMN, "_occurrence"], rsuffix="_old")
+        found = merged["_row"].notna()
+        self._matched_rows.extend(merged.loc[found, "_row"].astype(int))
+        self._added.extend(merged.loc[~found, self.header].values.tolist())
+
+        # products on both sides: rewrite the span of changed cells of each row
+        both = merged[found]
+        columns = [column for column in self.header if column != KEY_COLUMN]
+        changed = (
+            both[[f"{column}_old" for column in columns]].to_numpy()
+            != both[columns].to_numpy()
+        )
+        self.stats["changed_cells"] += int(changed.sum())
+        positions = [self.header.index(column) + 1 for column in columns]
+        data = []
+        for row_index in changed.any(axis=1).nonzero()[0]:
+            cols = [positions[i] for i in changed[row_index].nonzero()[0]]
+            first, last = min(cols), max(cols)
+            row = both.iloc[row_index]
+            data.append(
+                {
+                    "range": f"{rowcol_to_a1(int(row['_row']), first)}:"
+                    f"{rowcol_to_a1(int(row['_row']), last)}",
+                    "values": _as_values(
+                        [[row[column] for column in self.header[first - 1 : last]]]
+                    ),
+                }
+            )
+        self._update(data)
+
+    def _update(self, data) -> None:
+        for start in range(0, len(data), RANGES_PER_REQUEST):
+            self._call(
+                self.worksheet.batch_update,
+                data[start : start + RANGES_PER_REQUEST],
+                value_input_option=ValueInputOption.raw,
+            )
+
+    def finish(self) -> dict:
+        """Place the new products and trim removed rows; returns the diff counts."""
+        if not self._loaded:
+            self._load()
+        if self._old is None:
+            return {"rewritten": self._rewritten}
+
+        width = len(self.header)
+        added = self._added
+        kept = self._old.index.get_level_values(KEY_COLUMN).isin(self._kept_keys)
+        free_rows = sorted(set(self._old["_row"][~kept]) - set(self._matched_rows))
+        self.stats["added"] = len(added)
+        self.stats["removed"] = len(free_rows)
+        self._update(
+            [
+                {
+                    "range": f"{rowcol_to_a1(row_number, 1)}:"
+                    f"{rowcol_to_a1(row_number, width)}",
+                    "values": _as_values([row]),
+                }
+                for row_number, row in zip(free_rows, added)
+            ]
+        )
+        if len(added) > len(free_rows):
+            self._call(
+                self.worksheet.append_rows,
+                _as_values(added[len(free_rows) :]),
+                value_input_option=ValueInputOption.raw,
+            )
+        self._delete_rows(free_rows[len(added) :])
+        return self.stats
+
+    def _delete_rows(self, row_numbers) -> None:
+        if not row_numbers:
+            return
+        # bottom-up, so earlier deletions do not shift the later ones
+        requests = [
+            {
+                "deleteDimension": {
+                    "range": {
+                        "sheetId": self.worksheet.id,
+                        "dimension": "ROWS",
+                        "startIndex": first - 1,
+                        "endIndex": last,
+                    }
+                }
+            }
+            for first, last in reversed(_runs(row_numbers))
+        ]
+        self._call(self.worksheet.spreadsheet.batch_update, {"requests": requests})
+
+
+class BackgroundUpload:
+    """Pipelined upload: rows are written by a worker thread while the crawl goes on.
+
+    `add_rows` buffers rows into UPLOAD_CHUNK_ROWS chunks and hands them to
+    the uploader, blocking only when UPLOAD_QUEUE_CHUNKS chunks are already
+    waiting. An upload error stops the uploader and is raised by `finish`.
+    """
+
+    def __init__(self, writer: SheetWriter, chunk_rows: int = UPLOAD_CHUNK_ROWS):
+        self.writer = writer
+        self.chunk_rows = chunk_rows
+        self.uploaded_rows = 0
+        self.error = None
+        self._buffer = []
+        self._queue = queue.Queue(maxsize=UPLOAD_QUEUE_CHUNKS)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                self.writer.add(pd.DataFrame(chunk, columns=self.writer.header))
+                self.uploaded_rows += len(chunk)
+            except Exception as e:
+                self.error = e
+
+    def add_rows(self, rows) -> None:
+        self._buffer.extend(rows)
+        while len(self._buffer) >= self.chunk_rows:
+            chunk = self._buffer[: self.chunk_rows]
+            del self._buffer[: self.chunk_rows]
+            self._queue.put(chunk)
+
+    def keep(self, keys) -> None:
+        self.writer.keep(keys)
+
+    def abort(self) -> None:
+        """Stop the uploader without placing new products or trimming rows."""
+        self._buffer = []
+        self._queue.put(None)
+
+    def finish(self) -> dict:
+        if self._buffer:
+            self._queue.put(self._buffer)
+            self._buffer = []
+        self._queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.writer.finish()
+
 
 class GoogleSheetsService:
     def __init__(self):
-        creds = Credentials.from_service_account_info(
-            credentials.GOOGLE_SHEETS_CREDENTIALS,
-            scopes=credentials.GOOGLE_SHEETS_SCOPES,
+        self.client = get_client()
+        self.worksheet = get_worksheet(
+            credentials.GOOGLE_SHEETS_TARGET_SHEET_ID,
+            credentials.GOOGLE_SHEETS_TARGET_SHEET_SHEET_NAME,
         )
-        self.client = gspread.authorize(creds)
 
-        sheet_id = credentials.GOOGLE_SHEETS_TARGET_SHEET_ID
-        sheet_name = credentials.GOOGLE_SHEETS_TARGET_SHEET_SHEET_NAME
-        self.worksheet = self.client.open_by_key(sheet_id).worksheet(sheet_name)
+    def update_sheet(self, new_df: pd.DataFrame, keep_keys=()) -> dict | None:
+        """Bring the sheet in line with `new_df`, sending only what changed.
 
-    def update_sheet(self, new_df: pd.DataFrame):
+        See `SheetWriter`; rows of `keep_keys` are left untouched. Returns the
+        diff counts, or the number of rows when the sheet had to be rewritten.
+        """
         if new_df.empty:
             print("⚠️ DataFrame is empty. Nothing to update.")
-            return
+            return None
 
-        self.worksheet.clear()
-        gspread_dataframe.set_with_dataframe(
-            self.worksheet, new_df, include_index=False, include_column_header=True
-        )
+        writer = SheetWriter(self.worksheet, new_df.columns)
+        writer.keep(keep_keys)
+        writer.add(new_df)
+        return writer.finish()
+
+    def start_upload(self, header) -> BackgroundUpload:
+        """Start a pipelined upload of rows with the given columns."""
+        return BackgroundUpload(SheetWriter(self.worksheet, header))
@@ -0,0 +1,225 @@
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from apps.common.storage import data_path
+from apps.emami_ghafari_quantity_syncer.services.spool import valid_run_id
+
+TRACKED_COLUMNS = ("price", "regular_price", "sale_price", "quantity")
+MISSING = -1  # stored for an empty or malformed value
+CHANGES_SHOWN = 500  # products listed per kind of change in a changes() answer
+
+# technical number <-> SKU id, in order of first appearance; append-only
+_index_lock = threading.Lock()
+_sku_ids = None
+_sku_numbers = None
+
+
+def _history_path(*parts: str) -> str:
+    return data_path("emami_ghafari", "history", *parts)
+
+
+def _snapshot_dir(run_id: str) -> str:
+    return os.path.dirname(_history_path(run_id, "sku.npy"))
+
+
+def _load_index() -> None:
+    global _sku_ids, _sku_numbers
+    if _sku_ids is not None:
+        return
+    _sku_numbers = []
+    if os.path.exists(_history_path("skus.jsonl")):
+        with open(_history_path("skus.jsonl"), encoding="utf-8") as f:
+            _sku_numbers = [json.loads(line) for line in f]
+    _sku_ids = {number: sku for sku, number in enumerate(_sku_numbers)}
+
+
+def _assign_ids(numbers) -> np.ndarray:
+    """SKU ids of these technical numbers, adding the unknown ones to the index."""
+    with _index_lock:
+        _load_index()
+        ids = np.empty(len(numbers), dtype=np.int64)
+        new = []
+        for i, number in enumerate(numbers):
+            sku = _sku_ids.get(number)
+            if sku is None:
+                sku = _sku_ids[number] = len(_sku_numbers)
+                _sku_numbers.append(number)
+                new.append(number)
+            ids[i] = sku
+        if new:
+            with open(_history_path("skus.jsonl"), "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(number) + "\n" for number in new)
+        return ids
+
+
+def _lookup_id(number: str) -> int | None:
+    with _index_lock:
+        _load_index()
+        return _sku_ids.get(number)
+
+
+def _numbers(ids) -> list[str]:
+    with _index_lock:
+        _load_index()
+        return [_sku_numbers[sku] for sku in ids]
+
+
+def list_snapshots() -> list[str]:
+    """Run ids with a stored snapshot, oldest first."""
+    root = os.path.dirname(_history_path("skus.jsonl"))
+    return sorted(
+        name
+        for name in os.listdir(root)
+        if valid_run_id(name) and os.path.exists(os.path.join(root, name, "meta.json"))
+    )
+
+
+def _load(run_id: str) -> dict[str, np.ndarray] | None:
+    """A snapshot's columns, memory-mapped; None if there is none for `run_id`."""
+    if not valid_run_id(run_id):
+        return None
+    directory = _snapshot_dir(run_id)
+    if not os.path.exists(os.path.join(directory, "meta.json")):
+        return None
+    return {
+        column: np.load(os.path.join(directory, f"{column}.npy"), mmap_mode="r")
+        for column in ("sku", "quarantined") + TRACKED_COLUMNS
+    }
+
+
+def _diff(old: dict, new: dict) -> dict[str, np.ndarray]:
+    """SKU ids of the new, delisted, changed and sold-out products from `old` to `new`.
+
+    Both snapshots are sorted by SKU id. Products quarantined in `new` are
+    not counted as delisted.
+    """
+    common, old_at, new_at = np.intersect1d(
+        old["sku"], new["sku"], assume_unique=True, return_indices=True
+    )
+    delisted = np.setdiff1d(old["sku"], new["sku"], assume_unique=True)
+    changed = np.zeros(len(common), dtype=bool)
+    for column in TRACKED_COLUMNS:
+        changed |= old[column][old_at] != new[column][new_at]
+    in_stock = old["quantity"][old_at] > 0
+    return {
+        "new": np.setdiff1d(new["sku"], old["sku"], assume_unique=True),
+        "delisted": np.setdiff1d(delisted, new["quarantined"], assume_unique=True),
+        "changed": common[changed],
+        "stock_outs": common[in_stock & (new["quantity"][new_at] <= 0)],
+        "_old_at": old_at[changed],
+        "_new_at": new_at[changed],
+    }
+
+
+def _counts(diff: dict) -> dict[str, int]:
+    return {kind: len(ids) for kind, ids in diff.items() if not kind.startswith("_")}
+
+
+def write_snapshot(run_id: str, df, quarantined_keys=()) -> dict:
+    """Store a sync result as one .npy file per tracked column, sorted by SKU id.
+
+    Returns the snapshot's metadata, including the change counts against
+    the previous snapshot. A repeated technical number keeps its first row.
+    """
+    import pandas as pd
+
+    previous = list_snapshots()
+    ids, first = np.unique(
+        _assign_ids(df["technical_number"].astype(str).tolist()), return_index=True
+    )
+    columns = {
+        "sku": ids,
+        "quarantined": np.unique(_assign_ids([str(key) for key in quarantined_keys])),
+    }
+    for column in TRACKED_COLUMNS:
+        values = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype="float64")
+        values = values[first]
+        columns[column] = np.where(np.isnan(values), MISSING, values).astype(np.int64)
+
+    meta = {"run_id": run_id, "products": len(ids), "previous": None, "changes": None}
+    if previous:
+        meta["previous"] = previous[-1]
+        meta["changes"] = _counts(_diff(_load(previous[-1]), columns))
+
+    directory = _snapshot_dir(run_id)
+    tmp_dir = directory + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for column, values in columns.items():
+        np.save(os.path.join(tmp_dir, f"{column}.npy"), values)
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+    return meta
+
+
+def snapshots() -> list[dict]:
+    """Metadata of every snapshot, newest first."""
+    result = []
+    for run_id in reversed(list_snapshots()):
+        with open(os.path.join(_snapshot_dir(run_id), "meta.json")) as f:
+            result.append(json.load(f))
+    return result
+
+
+def _value(value) -> int | None:
+    return None if value == MISSING else int(value)
+
+
+def changes(since: str, until: str | None = None, limit: int = CHANGES_SHOWN):
+    """What changed between two snapshots (default: `since` -> the newest one).
+
+    Only the two snapshots are read. Returns None if either is unknown.
+    """
+    until = until or (list_snapshots() or [None])[-1]
+    old, new = _load(since), _load(until)
+    if old is None or new is None:
+        return None
+    diff = _diff(old, new)
+    changed = []
+    for old_at, new_at, number in zip(
+        diff["_old_at"][:limit],
+        diff["_new_at"][:limit],
+        _numbers(diff["changed"][:limit]),
+    ):
+        item = {"technical_number": number}
+        for column in TRACKED_COLUMNS:
+            before, after = old[column][old_at], new[column][new_at]
+            if before != after:
+                item[column] = [_value(before), _value(after)]
+        changed.append(item)
+    return {
+        "since": since,
+        "until": until,
+        "counts": _counts(diff),
+        "new": _numbers(diff["new"][:limit]),
+        "delisted": _numbers(diff["delisted"][:limit]),
+        "stock_outs": _numbers(diff["stock_outs"][:limit]),
+        "changed": changed,
+    }
+
+
+def series(technical_number: str) -> list[dict] | None:
+    """Tracked values of one product in every snapshot that lists it, oldest first.
+
+    Each snapshot is memory-mapped and binary-searched, so only a few pages
+    of it are read. Returns None for a technical number never synced.
+    """
+    sku = _lookup_id(technical_number)
+    if sku is None:
+        return None
+    points = []
+    for run_id in list_snapshots():
+        snapshot = _load(run_id)
+        at = int(np.searchsorted(snapshot["sku"], sku))
+        if at < len(snapshot["sku"]) and snapshot["sku"][at] == sku:
+            point = {"run_id": run_id}
+            for column in TRACKED_COLUMNS:
+                point[column] = _value(snapshot[column][at])
+            points.append(point)
+    return points
@@ -0,0 +1,52 @@
+import hashlib
+import json
+import os
+
+from apps.common.storage import data_path
+
+
+def content_hash(body: bytes) -> str:
+    return hashlib.blake2b(body, digest_size=8).hexdigest()
+
+
+class PageCache:
+    """Last response of each listing page: validators, body hash and parsed result.
+
+    One JSON file per page, rewritten atomically, so concurrent page
+    workers never touch the same file. An entry is only used for the URL it
+    was stored for.
+    """
+
+    def __init__(self, name: str = "store_api"):
+        self.name = name
+
+    def _path(self, page: int) -> str:
+        return data_path("emami_ghafari", "pages", self.name, f"{page}.json")
+
+    def get(self, page: int, url: str) -> dict | None:
+        path = self._path(page)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("url") == url else None
+
+    def put(self, page: int, entry: dict) -> None:
+        path = self._path(page)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def conditional_headers(entry: dict | None) -> dict:
+        """If-None-Match / If-Modified-Since for the validators the server sent."""
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
@@ -0,0 +1,84 @@
+import glob
+import json
+import os
+import re
+import time
+import uuid
+
+from apps.common.storage import data_path
+
+SPOOL_KEEP = 20  # most recent crawl results kept on disk
+
+_RUN_ID_RE = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}$")
+
+
+def new_run_id() -> str:
+    # sortable by start time
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:8]
+
+
+def valid_run_id(run_id: str | None) -> bool:
+    return bool(run_id) and bool(_RUN_ID_RE.match(run_id))
+
+
+def spool_path(run_id: str) -> str:
+    return data_path("emami_ghafari", "spool", f"{run_id}.csv.gz")
+
+
+def spool_exists(run_id: str | None) -> bool:
+    return valid_run_id(run_id) and os.path.exists(spool_path(run_id))
+
+
+def quarantine_path(run_id: str) -> str:
+    return data_path("emami_ghafari", "spool", f"{run_id}.quarantine.json")
+
+
+def write_quarantine(run_id: str, items: list[dict]) -> None:
+    """Save the products rejected by the crawl next to its result."""
+    with open(quarantine_path(run_id), "w", encoding="utf-8") as f:
+        json.dump(items, f, ensure_ascii=False)
+
+
+def read_quarantine(run_id: str) -> list[dict]:
+    if not valid_run_id(run_id) or not os.path.exists(quarantine_path(run_id)):
+        return []
+    with open(quarantine_path(run_id), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_spool(run_id: str, df) -> str:
+    """Save a crawl result as gzipped CSV (atomically); returns its path."""
+    path = spool_path(run_id)
+    tmp_path = path + ".tmp"
+    df.to_csv(tmp_path, index=False, compression="gzip")
+    os.replace(tmp_path, path)
+    _prune()
+    return path
+
+
+def read_spool(run_id: str):
+    """The saved crawl result as a DataFrame of text cells; None if it is gone."""
+    import pandas as pd
+
+    if not spool_exists(run_id):
+        return None
+    return pd.read_csv(
+        spool_path(run_id), dtype=str, keep_default_na=False, compression="gzip"
+    )
+
+
+def list_runs() -> list[str]:
+    """Run ids with a saved result, newest first."""
+    paths = glob.glob(os.path.join(os.path.dirname(spool_path("x")), "*.csv.gz"))
+    return sorted(
+        (os.path.basename(path)[: -len(".csv.gz")] for path in paths), reverse=True
+    )
+
+
+def _prune() -> None:
+    for run_id in list_runs()[SPOOL_KEEP:]:
+        for path in (spool_path(run_id), quarantine_path(run_id)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
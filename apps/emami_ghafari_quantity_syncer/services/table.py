@@ -0,0 +1,73 @@
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from apps.emami_ghafari_quantity_syncer.services.crawler import (
+    CATEGORICAL_COLUMNS,
+    INTEGER_COLUMNS,
+    PRODUCT_COLUMNS,
+)
+
+
+class ProductTable:
+    """Crawled product rows, stored column by column as pages arrive.
+
+    Prices and quantity go into int64 arrays with a missing-value mask,
+    the repetitive columns into int32 category codes, and only the free
+    text columns keep Python strings, so a page's row dicts can be dropped
+    as soon as it is added. `to_frame` wraps the arrays in a DataFrame
+    (nullable Int64, category and object columns) without copying them;
+    call it once, after the last page.
+    """
+
+    def __init__(self, columns=PRODUCT_COLUMNS):
+        self.columns = tuple(columns)
+        self._integers = {c: array("q") for c in self.columns if c in INTEGER_COLUMNS}
+        self._missing = {c: array("b") for c in self._integers}
+        self._codes = {c: array("i") for c in self.columns if c in CATEGORICAL_COLUMNS}
+        self._categories = {c: {} for c in self._codes}  # value -> code
+        self._text = {
+            c: []
+            for c in self.columns
+            if c not in self._integers and c not in self._codes
+        }
+        self._rows = 0
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def add_rows(self, rows) -> None:
+        """Append parsed rows (see crawler.parse_product)."""
+        for row in rows:
+            for column, values in self._integers.items():
+                value = row.get(column)
+                values.append(0 if value is None else int(value))
+                self._missing[column].append(value is None)
+            for column, codes in self._codes.items():
+                value = row.get(column)
+                if value is None:
+                    codes.append(-1)
+                else:
+                    categories = self._categories[column]
+                    codes.append(categories.setdefault(value, len(categories)))
+            for column, values in self._text.items():
+                values.append(row.get(column))
+            self._rows += 1
+
+    def to_frame(self) -> pd.DataFrame:
+        data = {}
+        for column in self.columns:
+            if column in self._integers:
+                data[column] = pd.arrays.IntegerArray(
+                    np.frombuffer(self._integers[column], dtype=np.int64),
+                    np.frombuffer(self._missing[column], dtype=np.bool_),
+                )
+            elif column in self._codes:
+                data[column] = pd.Categorical.from_codes(
+                    np.frombuffer(self._codes[column], dtype=np.int32),
+                    categories=list(self._categories[column]),
+                )
+            else:
+                data[column] = pd.Series(self._text[column], dtype=object)
+        return pd.DataFrame(data, columns=list(self.columns), copy=False)
@@ -0,0 +1,180 @@
+"""Local stand-in for the Digikala API endpoints used by the attribute scraper.
+
+Serves `/v1/categories/{category}/search/?page=N` and `/v2/product/{dkp}/`
+with configurable latency, 429 injection and product payload size, so
+scraper changes can be measured without touching production. Run from the
+repository root and point the scraper at it:
+
+    python -m benchmarks.fake_digikala --port 8765 --latency 0.05 --throttle 0.02
+    DIGIKALA_API_URL=http://127.0.0.1:8765 python app.py
+"""
+
+import argparse
+import json
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Process
+from typing import NamedTuple
+
+from benchmarks.product_parsing import make_product_payload
+
+_PLP_RE = re.compile(r"^/v1/categories/([^/]+)/search/\?page=(\d+)$")
+_PDP_RE = re.compile(r"^/v2/product/(\d+)/$")
+
+
+class FakeConfig(NamedTuple):
+    pages: int = 20  # listing pages per category
+    per_page: int = 20  # products per listing page
+    latency: float = 0.05  # mean response latency in seconds (exponential)
+    throttle: float = 0.0  # fraction of requests answered with 429
+    retry_after: float = 1.0  # Retry-After of the injected 429s
+    reviews: int = 200  # payload size knobs, see make_product_payload
+    variants: int = 30
+    attributes: int = 40
+    seed: int = 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    config = FakeConfig()
+    rng = random.Random()
+    rng_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        config = self.config
+        with self.rng_lock:
+            delay = self.rng.expovariate(1 / config.latency) if config.latency else 0
+            throttled = self.rng.random() < config.throttle
+        time.sleep(delay)
+        if throttled:
+            self._send(429, b"{}", {"Retry-After": str(config.retry_after)})
+            return
+
+        match = _PLP_RE.match(self.path)
+        if match:
+            category, page = match.group(1), int(match.group(2))
+            # each category lists its own stable range of DKP numbers
+            first = zlib.crc32(category.encode()) % 10_000 * config.pages
+            first = (first + page - 1) * config.per_page + 1
+            body = {
+                "status": 200,
+                "data": {
+                    "products": [
+                        {"id": dkp, "url": {"uri": f"/product/dkp-{dkp}/"}}
+                        for dkp in range(first, first + config.per_page)
+                    ],
+                    "pager": {"current_page": page, "total_pages": config.pages},
+                },
+            }
+            self._send(200, json.dumps(body).encode())
+            return
+
+        match = _PDP_RE.match(self.path)
+        if match:
+            payload = make_product_payload(
+                int(match.group(1)),
+                reviews=config.reviews,
+                variants=config.variants,
+                attributes=config.attributes,
+            )
+            self._send(200, payload)
+            return
+
+        self._send(404, b'{"status": 404}')
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(port, config=None):
+    """Serve the fake API on 127.0.0.1:`port` until the process exits."""
+    config = config or FakeConfig()
+    handler = type(
+        "Handler", (_Handler,), {"config": config, "rng": random.Random(config.seed)}
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_in_process(config=None, port=None, timeout=10, target=None):
+    """Run the fake API in a child process; returns (process, base_url).
+
+    A separate process keeps the server's CPU and memory out of the
+    scraper's measurements. `target` is the `serve` function of another
+    fake (default: this one).
+    """
+    port = port or free_port()
+    process = Process(target=target or serve, args=(port, config), daemon=True)
+    process.start()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                process.terminate()
+                raise
+            time.sleep(0.05)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def add_config_arguments(parser):
+    defaults = FakeConfig()
+    parser.add_argument("--pages", type=int, default=defaults.pages)
+    parser.add_argument("--per-page", type=int, default=defaults.per_page)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=defaults.latency,
+        help="mean response latency in seconds",
+    )
+    parser.add_argument(
+        "--throttle",
+        type=float,
+        default=defaults.throttle,
+        help="fraction of requests answered with 429",
+    )
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after)
+    parser.add_argument("--reviews", type=int, default=defaults.reviews)
+    parser.add_argument("--variants", type=int, default=defaults.variants)
+    parser.add_argument("--attributes", type=int, default=defaults.attributes)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def config_from_args(args):
+    return FakeConfig(**{field: getattr(args, field) for field in FakeConfig._fields})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+    print(f"fake Digikala API on http://127.0.0.1:{args.port}")
+    serve(args.port, config_from_args(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
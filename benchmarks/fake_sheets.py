@@ -0,0 +1,169 @@
+"""In-memory stand-in for the Google Sheets worksheet used by the Emami-Ghafari syncer.
+
+`FakeSheets` implements the worksheet calls `SheetWriter` makes
+(get_all_values, clear, append_rows, batch_update and the spreadsheet's
+deleteDimension batch_update), counts them, and can answer with the same
+429 `gspread.exceptions.APIError` the real API raises: at random, or once
+more than a per-minute quota of calls was made. Cells keep the types Sheets
+would store: USER_ENTERED input is parsed like Sheets does for numbers and
+dates (so "0123" becomes 123 and "1/2" a date serial number), RAW input is
+stored as sent. `install` points the syncer's Sheets service at it instead
+of the real spreadsheet.
+"""
+
+import collections
+import datetime
+import json
+import random
+import re
+import threading
+import time
+
+import requests
+from gspread.exceptions import APIError
+from gspread.utils import ValueInputOption, ValueRenderOption, a1_range_to_grid_range
+
+_NUMBER_RE = re.compile(r"^-?[0-9]+(\.[0-9]+)?$")
+_DATE_RE = re.compile(r"^([0-9]{1,2})/([0-9]{1,2})(?:/([0-9]{4}))?$")
+_EPOCH = datetime.date(1899, 12, 30)  # day 0 of Sheets date serial numbers
+
+
+def quota_error() -> APIError:
+    response = requests.models.Response()
+    response.status_code = 429
+    response._content = json.dumps(
+        {
+            "error": {
+                "code": 429,
+                "message": "Quota exceeded for quota metric 'Write requests'",
+                "status": "RESOURCE_EXHAUSTED",
+            }
+        }
+    ).encode()
+    return APIError(response)
+
+
+def user_entered(value):
+    """A cell value as Sheets stores USER_ENTERED input: numbers and dates are parsed."""
+    if not isinstance(value, str):
+        return value
+    if _NUMBER_RE.match(value):
+        number = float(value)
+        return int(number) if number.is_integer() else number
+    match = _DATE_RE.match(value)
+    if match:
+        month, day, year = match.groups()
+        try:
+            date = datetime.date(
+                int(year or datetime.date.today().year), int(month), int(day)
+            )
+        except ValueError:
+            return value
+        return (date - _EPOCH).days
+    return value
+
+
+def _rendered(value, value_render_option):
+    # formatted values are strings; unformatted ones keep the stored type
+    if value_render_option == ValueRenderOption.unformatted:
+        return value
+    return str(value)
+
+
+class FakeSheets:
+    """One worksheet kept as a list of rows of cell values (strings and numbers)."""
+
+    def __init__(
+        self,
+        rows=(),
+        latency: float = 0.0,
+        quota_errors: float = 0.0,
+        quota_per_minute: int = 0,
+        seed: int = 1,
+    ):
+        self.rows = [list(row) for row in rows]
+        self.latency = latency  # seconds per call
+        self.quota_errors = quota_errors  # fraction of calls failing with 429
+        self.quota_per_minute = quota_per_minute  # 0: unlimited
+        self.calls = collections.Counter()  # method -> calls, failed ones included
+        self.rejected = 0  # calls answered with 429
+        self.busy = 0.0  # seconds spent inside calls
+        self.id = 0
+        self.spreadsheet = _Spreadsheet(self)
+        self._recent = collections.deque()  # times of the calls in the last minute
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _call(self, method: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self.calls[method] += 1
+            while self._recent and self._recent[0] < now - 60:
+                self._recent.popleft()
+            self._recent.append(now)
+            over_quota = (
+                self.quota_per_minute and len(self._recent) > self.quota_per_minute
+            )
+            if over_quota or self._rng.random() < self.quota_errors:
+                self.rejected += 1
+                raise quota_error()
+            self.busy += self.latency
+        time.sleep(self.latency)
+
+    @property
+    def api_calls(self) -> int:
+        return sum(self.calls.values())
+
+    # gspread.Worksheet methods used by SheetWriter
+
+    def get_all_values(self, value_render_option=None, **kwargs):
+        self._call("get_all_values")
+        return [
+            [_rendered(cell, value_render_option) for cell in row] for row in self.rows
+        ]
+
+    def clear(self):
+        self._call("clear")
+        self.rows = []
+
+    @staticmethod
+    def _stored(row, value_input_option):
+        if value_input_option == ValueInputOption.user_entered:
+            return [user_entered(cell) for cell in row]
+        return list(row)
+
+    def append_rows(self, values, value_input_option=ValueInputOption.raw, **kwargs):
+        self._call("append_rows")
+        self.rows.extend(self._stored(row, value_input_option) for row in values)
+
+    def batch_update(self, data, value_input_option=ValueInputOption.raw, **kwargs):
+        self._call("batch_update")
+        width = len(self.rows[0]) if self.rows else 0
+        for item in data:
+            grid = a1_range_to_grid_range(item["range"])
+            row_index = grid["startRowIndex"]
+            while len(self.rows) <= row_index:
+                self.rows.append([""] * width)
+            row = self.rows[row_index]
+            start = grid["startColumnIndex"]
+            values = self._stored(item["values"][0], value_input_option)
+            row[start : start + len(values)] = values
+
+    def _delete_rows(self, body):
+        self._call("spreadsheet.batch_update")
+        for request in body["requests"]:
+            grid = request["deleteDimension"]["range"]
+            del self.rows[grid["startIndex"] : grid["endIndex"]]
+
+    def install(self, service_mod) -> None:
+        """Make `service_mod` (google_sheets.service) use this sheet, without credentials."""
+        service_mod.get_client = lambda: None
+        service_mod.get_worksheet = lambda sheet_id, sheet_name: self
+
+
+class _Spreadsheet:
+    def __init__(self, sheet: FakeSheets):
+        self._sheet = sheet
+
+    def batch_update(self, body):
+        self._sheet._delete_rows(body)
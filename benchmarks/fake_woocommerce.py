@@ -0,0 +1,178 @@
+"""Local stand-in for the WooCommerce Store API listing used by the Emami-Ghafari syncer.
+
+Serves `/wp-json/wc/store/v1/products?per_page=N&page=P` with the
+`X-WP-Total`/`X-WP-TotalPages` headers, configurable latency, 429 injection
+and catalog size, so the syncer can be measured without touching
+mvm5052.com. Run from the repository root and point the syncer at it:
+
+    python -m benchmarks.fake_woocommerce --port 8766 --products 10000
+    EMAMI_GHAFARI_STORE_URL=http://127.0.0.1:8766 python app.py
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+
+from benchmarks.fake_digikala import free_port, start_in_process
+
+_PRODUCTS_RE = re.compile(r"^/wp-json/wc/store/v1/products\?per_page=(\d+)&page=(\d+)$")
+
+_CATEGORIES = [f"لوازم یدکی-گروه {i}" for i in range(60)]
+
+
+class FakeConfig(NamedTuple):
+    products: int = 1000  # catalog size
+    latency: float = 0.05  # mean response latency in seconds (exponential)
+    throttle: float = 0.0  # fraction of requests answered with 429
+    retry_after: float = 1.0  # Retry-After of the injected 429s
+    description: int = 400  # characters of description per product (payload size)
+    seed: int = 1
+
+
+def make_product(number, description=400, seed=1):
+    """One product shaped like a Store API listing item."""
+    rng = random.Random(seed * 1_000_003 + number)
+    price = rng.randrange(100_000, 50_000_000)
+    quantity = rng.choice((0, 0, 1, 2, 5, 10, 100))
+    on_sale = rng.random() < 0.2
+    return {
+        "id": number + 1,
+        "name": f"قطعه نمونه شماره {number} مناسب خودرو",
+        "slug": f"eg-{number:07d}",
+        "sku": f"EG-{number:07d}",
+        "permalink": f"https://mvm5052.com/product/eg-{number:07d}/",
+        "description": ("توضیحات محصول " * (description // 14 + 1))[:description],
+        "prices": {
+            "price": str(price - 1000 if on_sale else price),
+            "regular_price": str(price),
+            "sale_price": str(price - 1000) if on_sale else "",
+            "currency_code": "IRT",
+            "currency_symbol": "تومان",
+            "currency_minor_unit": 0,
+        },
+        "categories": [
+            {"id": i, "name": _CATEGORIES[i], "slug": f"group-{i}"}
+            for i in rng.sample(range(len(_CATEGORIES)), 2)
+        ],
+        "images": [
+            {"src": f"https://mvm5052.com/wp-content/uploads/eg-{number}-{i}.jpg"}
+            for i in range(2)
+        ],
+        "is_in_stock": bool(quantity),
+        "stock_availability": {
+            "text": "موجود" if quantity else "ناموجود",
+            "class": "in-stock" if quantity else "out-of-stock",
+        },
+        "add_to_cart": {"minimum": 1, "maximum": quantity, "multiple_of": 1},
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    config = FakeConfig()
+    rng = random.Random()
+    rng_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        config = self.config
+        with self.rng_lock:
+            delay = self.rng.expovariate(1 / config.latency) if config.latency else 0
+            throttled = self.rng.random() < config.throttle
+        time.sleep(delay)
+        if throttled:
+            self._send(429, b"{}", {"Retry-After": str(config.retry_after)})
+            return
+
+        match = _PRODUCTS_RE.match(self.path)
+        if not match:
+            self._send(404, b'{"code": "rest_no_route"}')
+            return
+        per_page, page = int(match.group(1)), int(match.group(2))
+        first = (page - 1) * per_page
+        body = [
+            make_product(number, config.description, config.seed)
+            for number in range(first, min(first + per_page, config.products))
+        ]
+        self._send(
+            200,
+            json.dumps(body, ensure_ascii=False).encode(),
+            {
+                "X-WP-Total": str(config.products),
+                "X-WP-TotalPages": str(max(1, -(-config.products // per_page))),
+            },
+        )
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(port, config=None):
+    """Serve the fake Store API on 127.0.0.1:`port` until the process exits."""
+    config = config or FakeConfig()
+    handler = type(
+        "Handler", (_Handler,), {"config": config, "rng": random.Random(config.seed)}
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def start(config=None, port=None):
+    """Run the fake Store API in a child process; returns (process, base_url)."""
+    return start_in_process(config, port or free_port(), target=serve)
+
+
+def add_config_arguments(parser):
+    defaults = FakeConfig()
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=defaults.latency,
+        help="mean response latency in seconds",
+    )
+    parser.add_argument(
+        "--throttle",
+        type=float,
+        default=defaults.throttle,
+        help="fraction of requests answered with 429",
+    )
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after)
+    parser.add_argument("--description", type=int, default=defaults.description)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+
+
+def config_from_args(args, **overrides):
+    values = {
+        field: getattr(args, field)
+        for field in FakeConfig._fields
+        if hasattr(args, field)
+    }
+    return FakeConfig(**{**values, **overrides})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--products", type=int, default=FakeConfig().products)
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+    print(f"fake WooCommerce Store API on http://127.0.0.1:{args.port}")
+    serve(args.port, config_from_args(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""Allocation and CPU cost of parsing one Digikala /v2/product/ response.
+
+Compares the old `resp.json()` path with `apps.digikala.records.parse_product`
+on a synthetic payload shaped like the real API (reviews, variants, images,
+specifications). Run from the repository root:
+
+    python -m benchmarks.product_parsing --reviews 200 --variants 30
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from apps.digikala.records import parse_product
+
+
+def make_product_payload(dkp=1, reviews=200, variants=30, images=40, attributes=40):
+    product = {
+        "id": dkp,
+        "title_fa": f"گوشی موبایل نمونه مدل {dkp}",
+        "title_en": f"Sample Phone {dkp}",
+        "url": {"uri": f"/product/dkp-{dkp}/"},
+        "status": "marketable",
+        "images": {
+            "main": {"url": [f"https://dkstatics-public.digikala.com/{dkp}.jpg"] * 4},
+            "list": [
+                {
+                    "url": [f"https://dkstatics-public.digikala.com/{dkp}-{i}.jpg"] * 4,
+                    "webp_url": [
+                        f"https://dkstatics-public.digikala.com/{dkp}-{i}.webp"
+                    ]
+                    * 4,
+                }
+                for i in range(images)
+            ],
+        },
+        "variants": [
+            {
+                "id": i,
+                "seller": {"title": f"فروشگاه {i}", "rating": {"total": 4.5}},
+                "price": {"selling_price": 1_000_000 + i, "rrp_price": 1_200_000},
+                "color": {"title": "مشکی", "hex_code": "#000000"},
+                "warranty": {"title_fa": "گارانتی ۱۸ ماهه"},
+            }
+            for i in range(variants)
+        ],
+        "reviews": [
+            {
+                "id": i,
+                "title": "نقد کاربر",
+                "comment": "کیفیت ساخت و باتری این محصول خوب است. " * 10,
+                "rate": 5,
+            }
+            for i in range(reviews)
+        ],
+        "specifications": [
+            {
+                "title": "مشخصات کلی",
+                "attributes": [
+                    {"title": f"ویژگی {i}", "values": [f"مقدار {i}", f"{dkp % 7}"]}
+                    for i in range(attributes)
+                ],
+            }
+        ],
+    }
+    return json.dumps(
+        {"status": 200, "data": {"product": product}}, ensure_ascii=False
+    ).encode()
+
+
+def parse_with_resp_json(raw):
+    # what extract_product_data did before: resp.json() on the whole payload
+    product = json.loads(raw.decode("utf-8"))["data"]["product"]
+    return {
+        "title": product.get("title_fa"),
+        "attributes": [
+            {attr.get("title"): attr.get("values")}
+            for attr in product.get("specifications")[0].get("attributes")
+        ],
+    }
+
+
+def measure(parse, raw, repeat):
+    tracemalloc.start()
+    result = parse(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    kept = [parse(raw) for _ in range(repeat)]
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        parse(raw)
+    elapsed = (time.perf_counter() - started) / repeat
+    return result, peak, retained / repeat, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reviews", type=int, default=200)
+    parser.add_argument("--variants", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    raw = make_product_payload(reviews=args.reviews, variants=args.variants)
+    print(f"payload: {len(raw):,} bytes")
+    for name, parse in (
+        ("resp.json()", parse_with_resp_json),
+        ("parse_product", lambda body: parse_product(body, 1)),
+    ):
+        _, peak, retained, elapsed = measure(parse, raw, args.repeat)
+        print(
+            f"{name:>14}: peak {peak:>9,.0f} B/product, "
+            f"retained {retained:>7,.0f} B/product, {elapsed * 1000:.2f} ms/product"
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
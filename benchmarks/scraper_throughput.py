@@ -0,0 +1,111 @@
+"""End-to-end throughput of the Digikala attribute scraper against a local fake API.
+
+Drives `digi_attributes_scraping.generate` over categories served by
+`benchmarks.fake_digikala` (in a child process) and reports products/sec,
+p50/p99 per-product latency (from submitting a product to its result,
+including limiter waits and retries) and the scraper's peak RSS. State goes
+to a temporary data directory, and product data is always fetched fresh.
+Run from the repository root:
+
+    python -m benchmarks.scraper_throughput --categories 2 --pages 10 --rate 200
+    python -m benchmarks.scraper_throughput --throttle 0.05 --latency 0.2
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_digikala import (
+    add_config_arguments,
+    config_from_args,
+    start_in_process,
+)
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(scraper, category_urls, rate, workers):
+    latencies = []
+    extract_product_data = scraper.extract_product_data
+
+    def timed_extract(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return extract_product_data(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    scraper.extract_product_data = timed_extract
+    counts = {}
+    started = time.perf_counter()
+    try:
+        for message in scraper.generate(
+            category_urls, rate=rate, workers=workers, force_refresh=True
+        ):
+            data = message.partition("data: ")[2]
+            if data:
+                event_type = json.loads(data)["type"]
+                counts[event_type] = counts.get(event_type, 0) + 1
+    finally:
+        scraper.extract_product_data = extract_product_data
+    return counts, time.perf_counter() - started, latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--categories", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=100.0)
+    parser.add_argument("--workers", type=int, default=8)
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server, base_url = start_in_process(config_from_args(args))
+    # both are read at import time
+    os.environ["DIGIKALA_API_URL"] = base_url
+    os.environ["AUTOMOBY_DATA_DIR"] = tempfile.mkdtemp(prefix="scraper-bench-")
+    from apps import digi_attributes_scraping as scraper
+
+    category_urls = [
+        f"https://www.digikala.com/search/category-bench-{i}/"
+        for i in range(args.categories)
+    ]
+    try:
+        counts, elapsed, latencies = run(
+            scraper, category_urls, args.rate, args.workers
+        )
+    finally:
+        server.terminate()
+
+    products = counts.get("PDP_PROGRESS", 0)
+    print(f"fake API: {base_url}, data dir: {os.environ['AUTOMOBY_DATA_DIR']}")
+    print(f"events: {counts}")
+    print(
+        f"{products} products in {elapsed:.1f} s: {products / elapsed:.1f} products/s"
+    )
+    if latencies:
+        print(
+            f"per-product latency: p50 {percentile(latencies, 0.5) * 1000:.0f} ms, "
+            f"p99 {percentile(latencies, 0.99) * 1000:.0f} ms, "
+            f"mean {statistics.fmean(latencies) * 1000:.0f} ms"
+        )
+    print(f"peak RSS: {peak_rss_bytes() / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
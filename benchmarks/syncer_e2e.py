@@ -0,0 +1,159 @@
+"""End-to-end run of the Emami-Ghafari syncer against local WooCommerce and Sheets fakes.
+
+For each catalog size, drives `emami_ghafari_quantity_syncer.main.generate`
+in a fresh child process against `benchmarks.fake_woocommerce` (in its own
+process) and `benchmarks.fake_sheets` (in the child, so the fake sheet's
+rows count towards its memory). Reports, per sync:
+- crawl time: start to the last crawled page
+- upload time: end of the crawl to DONE, i.e. the part of the pipelined
+  upload not hidden behind the crawl (plus spooling)
+- Sheets API calls, and how many of them were answered with 429
+- the child's peak RSS
+
+Every size gets a temporary data directory, so the first sync starts with a
+cold page cache and an empty sheet; `--runs 2` adds a second sync that
+diffs against the first. Run from the repository root:
+
+    python -m benchmarks.syncer_e2e --products 1000 10000 100000
+    python -m benchmarks.syncer_e2e --products 10000 --runs 2 --sheets-rate 1
+    python -m benchmarks.syncer_e2e --products 10000 --quota-errors 0.02
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks import fake_woocommerce
+from benchmarks.fake_sheets import FakeSheets
+from benchmarks.scraper_throughput import peak_rss_bytes
+
+
+def run_syncs(args, base_url, results):
+    """Child process: configure the syncer, run `args.runs` syncs, report each."""
+    # both are read at import time
+    os.environ["EMAMI_GHAFARI_STORE_URL"] = base_url
+    os.environ["AUTOMOBY_DATA_DIR"] = tempfile.mkdtemp(prefix="syncer-bench-")
+    from apps.emami_ghafari_quantity_syncer import main as syncer
+    from apps.emami_ghafari_quantity_syncer.services import crawler
+    from apps.emami_ghafari_quantity_syncer.services.google_sheets import service
+
+    crawler.REQUESTS_PER_SECOND = args.rate
+    crawler.PAGE_WORKERS = args.workers
+    service.sheets_limiter.set_rate(args.sheets_rate)
+    sheets = FakeSheets(
+        latency=args.sheets_latency,
+        quota_errors=args.quota_errors,
+        quota_per_minute=args.sheets_quota,
+    )
+    sheets.install(service)
+
+    for run in range(1, args.runs + 1):
+        calls, rejected = sheets.api_calls, sheets.rejected
+        crawl_end = hit_rate = None
+        errors = []
+        started = time.perf_counter()
+        for message in syncer.generate():
+            data = message.partition("data: ")[2]
+            if not data:
+                continue
+            event = json.loads(data)
+            if "hit_rate" in event:
+                # the last of these is the end-of-crawl summary
+                crawl_end, hit_rate = time.perf_counter(), event["hit_rate"]
+            elif event["type"] == "ERROR":
+                errors.append(event["msg"])
+        finished = time.perf_counter()
+        crawl_end = crawl_end or finished
+        results.put(
+            {
+                "run": run,
+                "crawl": crawl_end - started,
+                "upload": finished - crawl_end,
+                "hit_rate": hit_rate or 0.0,
+                "calls": sheets.api_calls - calls,
+                "rejected": sheets.rejected - rejected,
+                "sheet_rows": max(0, len(sheets.rows) - 1),
+                "errors": errors,
+                "peak_rss": peak_rss_bytes(),
+            }
+        )
+    results.put(None)
+
+
+def benchmark(args, products):
+    server, base_url = fake_woocommerce.start(
+        fake_woocommerce.config_from_args(args, products=products)
+    )
+    # spawn: the child must import the syncer after setting its environment
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    child = context.Process(target=run_syncs, args=(args, base_url, results))
+    child.start()
+    try:
+        while True:
+            result = results.get()
+            if result is None:
+                break
+            yield result
+        child.join()
+    finally:
+        if child.is_alive():
+            child.terminate()
+        server.terminate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--products", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+    )
+    parser.add_argument("--runs", type=int, default=1, help="syncs per catalog size")
+    parser.add_argument(
+        "--rate", type=float, default=100.0, help="Store API requests per second"
+    )
+    parser.add_argument("--workers", type=int, default=4, help="pages in flight")
+    parser.add_argument(
+        "--sheets-rate",
+        type=float,
+        default=100.0,
+        help="Sheets calls per second (the real quota allows 1)",
+    )
+    parser.add_argument(
+        "--sheets-latency", type=float, default=0.1, help="seconds per Sheets call"
+    )
+    parser.add_argument(
+        "--quota-errors",
+        type=float,
+        default=0.0,
+        help="fraction of Sheets calls answered with 429",
+    )
+    parser.add_argument(
+        "--sheets-quota",
+        type=int,
+        default=0,
+        help="Sheets calls per minute before 429s (0: unlimited)",
+    )
+    fake_woocommerce.add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    for products in args.products:
+        for result in benchmark(args, products):
+            print(
+                f"{products:>7,} products, sync {result['run']}: "
+                f"crawl {result['crawl']:6.1f} s "
+                f"({result['hit_rate']:.0%} pages unchanged), "
+                f"upload {result['upload']:5.1f} s, "
+                f"{result['calls']} Sheets calls ({result['rejected']} rejected), "
+                f"{result['sheet_rows']:,} sheet rows, "
+                f"peak RSS {result['peak_rss'] / 2**20:.0f} MiB"
+            )
+            for error in result["errors"]:
+                print(f"    ERROR: {error}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Peak memory of building the Emami-Ghafari crawl result DataFrame.
+
+Compares the old path (every page's row dicts kept in one list, then
+`pd.DataFrame(products)`) with `services.table.ProductTable`, which stores
+each page column by column as it arrives. Rows are synthetic but shaped like
+`crawler.parse_product` output, with fresh string objects per row as JSON
+decoding would produce. Run from the repository root:
+
+    python -m benchmarks.syncer_frame --products 100000
+"""
+
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+from apps.emami_ghafari_quantity_syncer.services.crawler import PRODUCT_COLUMNS
+from apps.emami_ghafari_quantity_syncer.services.table import ProductTable
+
+PER_PAGE = 100  # the Store API page size the crawler uses
+
+_CATEGORIES = [f"لوازم یدکی-گروه {i}" for i in range(60)]
+
+
+def _fresh(text):
+    # a new string object, like every value json.loads returns
+    return text.encode().decode()
+
+
+def make_page(page, per_page=PER_PAGE, seed=1):
+    """Parsed rows of one listing page."""
+    rng = random.Random(seed * 1_000_003 + page)
+    rows = []
+    for i in range(per_page):
+        number = (page - 1) * per_page + i
+        price = rng.randrange(100_000, 50_000_000)
+        quantity = rng.choice((0, 0, 1, 2, 5, 10, 100))
+        rows.append(
+            {
+                "name": f"قطعه نمونه شماره {number} مناسب خودرو",
+                "technical_number": f"EG-{number:07d}",
+                "quantity": quantity,
+                "categories": _fresh(rng.choice(_CATEGORIES)),
+                "in_stock": _fresh("موجود" if quantity else "ناموجود"),
+                "price": str(price),
+                "regular_price": str(price),
+                "sale_price": str(price - 1000) if rng.random() < 0.2 else None,
+                "currency_symbol": _fresh("تومان"),
+                "url": f"https://mvm5052.com/product/eg-{number:07d}/",
+            }
+        )
+    return rows
+
+
+def build_with_dicts(pages):
+    products = []
+    for page in range(1, pages + 1):
+        products.extend(make_page(page))
+    return pd.DataFrame(products, columns=PRODUCT_COLUMNS)
+
+
+def build_with_table(pages):
+    table = ProductTable(PRODUCT_COLUMNS)
+    for page in range(1, pages + 1):
+        table.add_rows(make_page(page))
+    return table.to_frame()
+
+
+def measure(build, pages):
+    tracemalloc.start()
+    started = time.perf_counter()
+    df = build(pages)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, peak, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--products", type=int, default=100_000)
+    args = parser.parse_args(argv)
+    pages = max(1, args.products // PER_PAGE)
+
+    print(f"{pages * PER_PAGE:,} products in {pages:,} pages")
+    for name, build in (
+        ("list of dicts", build_with_dicts),
+        ("ProductTable", build_with_table),
+    ):
+        df, peak, elapsed = measure(build, pages)
+        size = df.memory_usage(deep=True).sum()
+        print(
+            f"{name:>13}: peak {peak / 2**20:7.1f} MiB, "
+            f"DataFrame {size / 2**20:6.1f} MiB, {elapsed:.2f} s"
+        )
+        del df
+
+
+if __name__ == "__main__":
+    sys.exit(main())